@@ -1,19 +1,26 @@
-
-
 from app_instance import app, logger
+from app.client.grpc_channel_pool import channel_registry
+from app.proto.gen import BaseModel1_pb2, BaseModel1_pb2_grpc
 
 
 
 # In this module you should put logic for calling GRPC endpoints of other services
+# Get the stubs from channel_registry on each call instead of opening a channel: the connections to each
+# target are pooled and reused. Use channel_registry.aio_stub() from async code
 
+ANOTHER_SERVICE_TARGET = getattr(app.state, 'GRPC_CLIENT_ANOTHER_SERVICE_TARGET', 'localhost:50051')
 
 
 def method_that_calls_grpc_endpoint_1():
     logger.info("Some logic here")
+    stub = channel_registry.stub(ANOTHER_SERVICE_TARGET, BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub)
+    return stub.ExampleCall(BaseModel1_pb2.ExampleCallRequest(userId="user_id"), timeout=5)
 
 
-def method_that_calls_grpc_endpoint_2():
+async def method_that_calls_grpc_endpoint_2():
     logger.info("Some logic here")
+    stub = channel_registry.aio_stub(ANOTHER_SERVICE_TARGET, BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub)
+    return await stub.ExampleCall(BaseModel1_pb2.ExampleCallRequest(userId="user_id"), timeout=5)
 
 
 def method_that_calls_grpc_endpoint_3():
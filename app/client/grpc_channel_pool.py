@@ -0,0 +1,273 @@
+# grpc_channel_pool.py
+
+import asyncio
+import collections
+import itertools
+import threading
+import time
+
+import grpc
+
+from app_instance import app, logger, shutdown_hooks
+from app.utils.resilience import get_policy
+
+# Status codes that count as failures of the target for its resilience policy
+FAILURE_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED,
+                 grpc.StatusCode.INTERNAL, grpc.StatusCode.UNKNOWN}
+
+
+class TargetMetrics:
+    """Latency and errors of the unary calls to one target, over the sync and grpc.aio channels."""
+
+    def __init__(self, target, window=1000):
+        self.target = target
+        self.calls = 0
+        self.errors = 0
+        self.error_codes = collections.Counter()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        # Latest latencies, for the percentiles
+        self._latencies = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, code):
+        with self._lock:
+            self.calls += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self._latencies.append(latency)
+            if code != grpc.StatusCode.OK:
+                self.errors += 1
+                self.error_codes[code.name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls = self.calls
+            snapshot = {
+                "calls": calls,
+                "errors": self.errors,
+                "error_codes": dict(self.error_codes),
+                "latency_avg": self.latency_total / calls if calls else 0.0,
+                "latency_max": self.latency_max,
+            }
+        for p in (50, 90, 99):
+            snapshot[f"latency_p{p}"] = latencies[min(len(latencies) - 1, len(latencies) * p // 100)] if latencies else 0.0
+        return snapshot
+
+
+class MetricsInterceptor(grpc.UnaryUnaryClientInterceptor):
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        start = time.perf_counter()
+        outcome = continuation(client_call_details, request)
+        # Called right away for blocking calls, on completion for .future() calls
+        outcome.add_done_callback(lambda call: self.metrics.record(time.perf_counter() - start, call.code()))
+        return outcome
+
+
+class AioMetricsInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        start = time.perf_counter()
+        call = await continuation(client_call_details, request)
+        code = await call.code()
+        self.metrics.record(time.perf_counter() - start, code)
+        return call
+
+
+class ResilienceInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Fails calls fast with a DependencyUnavailableError while the target's circuit is open or its limit reached."""
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        token = self.policy.acquire()
+        try:
+            outcome = continuation(client_call_details, request)
+        except grpc.RpcError as e:
+            self.policy.release(token, e.code() in FAILURE_CODES)
+            raise
+        except BaseException:
+            self.policy.release(token, True)
+            raise
+        outcome.add_done_callback(lambda call: self.policy.release(token, call.code() in FAILURE_CODES))
+        return outcome
+
+
+class AioResilienceInterceptor(grpc.aio.UnaryUnaryClientInterceptor):
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    async def intercept_unary_unary(self, continuation, client_call_details, request):
+        token = self.policy.acquire()
+        failed = True
+        try:
+            call = await continuation(client_call_details, request)
+            failed = await call.code() in FAILURE_CODES
+            return call
+        except grpc.RpcError as e:
+            failed = e.code() in FAILURE_CODES
+            raise
+        finally:
+            self.policy.release(token, failed)
+
+
+class ChannelPool:
+    """'size' channels to one target, handed out round-robin.
+
+    Each channel has its own connection, so concurrent calls are spread over several HTTP/2
+    connections instead of queueing behind the stream limit of one. With a 'loop' the channels
+    are grpc.aio channels of that event loop, otherwise sync channels. Stubs are cached per
+    channel, so getting one per call costs a dict lookup.
+    """
+
+    def __init__(self, target, size, options, metrics, policy, credentials=None, loop=None):
+        self.target = target
+        self.size = size
+        self.loop = loop
+        self.last_used = time.monotonic()
+        self._counter = itertools.count()
+        self._stubs = {}
+        # A local subchannel pool per channel, or channels with the same arguments share one connection
+        options = list(options) + [('grpc.use_local_subchannel_pool', 1)]
+        if loop is None:
+            # Calls that fail fast don't reach the metrics
+            interceptors = [ResilienceInterceptor(policy), MetricsInterceptor(metrics)]
+            if credentials is None:
+                channels = [grpc.insecure_channel(target, options) for _ in range(size)]
+            else:
+                channels = [grpc.secure_channel(target, credentials, options) for _ in range(size)]
+            self.channels = [grpc.intercept_channel(channel, *interceptors) for channel in channels]
+            self._raw_channels = channels
+        else:
+            interceptors = [AioResilienceInterceptor(policy), AioMetricsInterceptor(metrics)]
+            if credentials is None:
+                self.channels = [grpc.aio.insecure_channel(target, options, interceptors=interceptors) for _ in range(size)]
+            else:
+                self.channels = [grpc.aio.secure_channel(target, credentials, options, interceptors=interceptors) for _ in range(size)]
+            self._raw_channels = self.channels
+
+    def stub(self, stub_class):
+        self.last_used = time.monotonic()
+        index = next(self._counter) % self.size
+        stub = self._stubs.get((stub_class, index))
+        if stub is None:
+            stub = self._stubs[(stub_class, index)] = stub_class(self.channels[index])
+        return stub
+
+    def close(self):
+        if self.loop is None:
+            for channel in self._raw_channels:
+                channel.close()
+        elif self.loop.is_running():
+            # grpc.aio channels are closed on their loop
+            asyncio.run_coroutine_threadsafe(self._close_aio(), self.loop)
+
+    async def _close_aio(self):
+        await asyncio.gather(*(channel.close() for channel in self._raw_channels))
+
+
+class ChannelRegistry:
+    """Channel pools by target, shared by the whole process.
+
+    Channel settings come from the grpc_client config. Pools unused for 'idle_timeout' seconds are
+    closed by a background thread and created again on the next call, so get a stub for each call
+    (or batch of calls) instead of keeping one around.
+    """
+
+    def __init__(self, channels_per_target=2, options=(), idle_timeout=300, secure=False):
+        self.channels_per_target = channels_per_target
+        self.options = list(options)
+        self.idle_timeout = idle_timeout
+        self.secure = secure
+        self._pools = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def pool(self, target, loop=None):
+        key = (target, loop)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    metrics = self._metrics.get(target)
+                    if metrics is None:
+                        metrics = self._metrics[target] = TargetMetrics(target)
+                    credentials = grpc.ssl_channel_credentials() if self.secure else None
+                    pool = self._pools[key] = ChannelPool(target, self.channels_per_target, self.options, metrics,
+                                                           get_policy(f"grpc:{target}"), credentials, loop)
+                    logger.info(f"Opened {self.channels_per_target} {'grpc.aio ' if loop else ''}channels to {target}")
+                    self._start_reaper()
+        return pool
+
+    def stub(self, target, stub_class):
+        """A stub of the sync channels to 'target'."""
+        return self.pool(target).stub(stub_class)
+
+    def aio_stub(self, target, stub_class):
+        """A stub of the grpc.aio channels to 'target' on the running event loop."""
+        return self.pool(target, asyncio.get_running_loop()).stub(stub_class)
+
+    def _start_reaper(self):
+        if self._reaper is None and self.idle_timeout:
+            self._reaper = threading.Thread(target=self._evict_idle_loop, name="grpc-channel-reaper", daemon=True)
+            self._reaper.start()
+
+    def _evict_idle_loop(self):
+        while not self._stop.wait(max(1, self.idle_timeout / 2)):
+            self.evict_idle()
+
+    def evict_idle(self):
+        """Closes the pools unused for idle_timeout seconds."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, pool in self._pools.items() if now - pool.last_used > self.idle_timeout]
+            pools = [self._pools.pop(key) for key in idle]
+        for pool in pools:
+            logger.info(f"Closing idle channels to {pool.target}")
+            pool.close()
+
+    def metrics(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {target_metrics.target: target_metrics.snapshot() for target_metrics in metrics}
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
+
+
+def build_channel_options():
+    """Channel arguments of the client channels, from the grpc_client config."""
+    return [
+        ('grpc.keepalive_time_ms', getattr(app.state, 'GRPC_CLIENT_KEEPALIVE_TIME_MS', 300000)),
+        ('grpc.keepalive_timeout_ms', getattr(app.state, 'GRPC_CLIENT_KEEPALIVE_TIMEOUT_MS', 20000)),
+        ('grpc.keepalive_permit_without_calls', int(getattr(app.state, 'GRPC_CLIENT_KEEPALIVE_PERMIT_WITHOUT_CALLS', False))),
+        ('grpc.max_receive_message_length', getattr(app.state, 'GRPC_CLIENT_MAX_RECEIVE_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+        ('grpc.max_send_message_length', getattr(app.state, 'GRPC_CLIENT_MAX_SEND_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+    ]
+
+
+channel_registry = ChannelRegistry(
+    channels_per_target=getattr(app.state, 'GRPC_CLIENT_CHANNELS_PER_TARGET', 2),
+    options=build_channel_options(),
+    idle_timeout=getattr(app.state, 'GRPC_CLIENT_IDLE_TIMEOUT', 300),
+    secure=getattr(app.state, 'GRPC_CLIENT_SECURE', False),
+)
+shutdown_hooks.append(channel_registry.close)
@@ -0,0 +1,223 @@
+# http_client.py
+
+import asyncio
+import collections
+import datetime
+import email.utils
+import random
+import threading
+import weakref
+from urllib.parse import urlsplit
+
+import httpx
+
+from app_instance import app, logger, startup_hooks, shutdown_hooks
+from app.utils.resilience import get_policy
+
+try:
+    import h2  # noqa: F401
+except ImportError:  # HTTP/2 needs httpx[http2], without it the client speaks HTTP/1.1
+    h2 = None
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header, in seconds or an HTTP date, None when it's neither."""
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:  # '-0000' dates, UTC as well
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class HttpClient:
+    """Process-wide async HTTP client over one httpx.AsyncClient per event loop.
+
+    Connections are pooled per host and kept alive between requests, so a call to an upstream
+    doesn't pay a TCP and TLS handshake each time. At most 'max_concurrency_per_host' requests
+    are in flight per host, the others wait for a slot. Each host also has a resilience policy:
+    while its circuit is open, or its adaptive concurrency limit is reached, requests fail fast
+    with a DependencyUnavailableError instead of being sent. Idempotent requests are retried after
+    connection errors, timeouts and 429/502/503/504 responses, with exponential backoff and full
+    jitter, or after the Retry-After delay of the response; a response asking to wait longer than
+    'backoff_max' is returned as is. Concurrent GETs of the same URL share one upstream request and its response.
+
+    The connections, per host slots and GETs in flight belong to the event loop that made them, so
+    the client can be used from the app's loop and from the dedicated Pub/Sub loop alike.
+    """
+
+    def __init__(self, timeout=10, connect_timeout=5, max_connections=100, max_keepalive_connections=20,
+                 keepalive_expiry=30, http2=True, max_concurrency_per_host=50, retries=2, backoff_base=0.1, backoff_max=2):
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2 and h2 is not None
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Per event loop: {loop: _LoopState}, dropped with the loop
+        self._loops = weakref.WeakKeyDictionary()
+        self._loops_lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            with self._loops_lock:
+                state = self._loops.setdefault(loop, _LoopState())
+        return state
+
+    @property
+    def client(self):
+        # Created on each event loop by its first request, or by start() on the app's loop
+        state = self._state()
+        if state.client is None:
+            self.start()
+        return state.client
+
+    def start(self):
+        state = self._state()
+        if state.client is None:
+            state.client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http2=self.http2)
+            logger.info(f"HTTP client started, HTTP/2: {self.http2}, {self.limits}")
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            states, self._loops = list(self._loops.items()), weakref.WeakKeyDictionary()
+        for state_loop, state in states:
+            if state.client is None:
+                continue
+            if state_loop is loop:
+                await state.client.aclose()
+            elif state_loop.is_running():
+                # Connections are closed on the loop they belong to
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(state.client.aclose(), state_loop))
+
+    async def request(self, method, url, retries=None, **kwargs):
+        """Sends a request and returns the httpx.Response, which has been read. Raises httpx errors once out of retries."""
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        if method not in IDEMPOTENT_METHODS:
+            retries = 0
+        host = urlsplit(url).netloc
+        semaphores = self._state().semaphores
+        semaphore = semaphores.get(host)
+        if semaphore is None:
+            semaphore = semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        policy = get_policy(f"http:{host}")
+        attempt = 0
+        while True:
+            async with semaphore:
+                # A request that fails fast isn't retried
+                token = policy.acquire()
+                # Anything but a classified response is a failure: a cancellation, a decoding error...
+                failed = True
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                    failed = response.status_code >= 500 or response.status_code in RETRY_STATUS_CODES
+                except httpx.TransportError as e:
+                    if attempt >= retries:
+                        self.counters['errors'] += 1
+                        raise
+                    logger.warning(f"{method} {url} failed ({type(e).__name__}), retrying")
+                    delay = self._backoff(attempt)
+                else:
+                    delay = None
+                    if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                        delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                    if delay is None:
+                        self.counters['requests'] += 1
+                        return response
+                    logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+                finally:
+                    policy.release(token, failed)
+            # Back off without holding the host's slot
+            self.counters['retries'] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt, retry_after=None):
+        """Seconds to wait before the next attempt, None when the server asked to wait longer than backoff_max."""
+        if retry_after is not None:
+            delay = parse_retry_after(retry_after)
+            if delay is not None:
+                # Retrying sooner than the server asked would only be refused again, the response goes back to the caller
+                return delay if delay <= self.backoff_max else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def get(self, url, params=None, headers=None, **kwargs):
+        """GET that joins an identical request already in flight instead of sending another one.
+
+        Requests are identical when their url, params, headers and other arguments (auth, cookies,
+        timeout...) are equal. A GET with an argument that can't be compared by value, like a cookies
+        dict, is sent on its own. The joined callers get the same response object, which they should
+        treat as read-only.
+        """
+        key = (url, tuple(sorted(httpx.QueryParams(params).multi_items())), tuple(sorted(httpx.Headers(headers).multi_items())),
+               tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return await self.request('GET', url, params=params, headers=headers, **kwargs)
+        in_flight = self._state().in_flight
+        task = in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.request('GET', url, params=params, headers=headers, **kwargs))
+            in_flight[key] = task
+            task.add_done_callback(lambda _: in_flight.pop(key, None))
+        else:
+            self.counters['coalesced'] += 1
+        # A cancelled caller doesn't cancel the request for the others
+        return await asyncio.shield(task)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        with self._loops_lock:
+            states = list(self._loops.values())
+        return {**self.counters, "event_loops": len(states), "in_flight_gets": sum(len(state.in_flight) for state in states),
+                "hosts": len({host for state in states for host in state.semaphores})}
+
+
+class _LoopState:
+    """What HttpClient keeps for one event loop."""
+
+    __slots__ = ('client', 'semaphores', 'in_flight')
+
+    def __init__(self):
+        self.client = None
+        self.semaphores = {}
+        self.in_flight = {}
+
+
+http_client = HttpClient(
+    timeout=getattr(app.state, 'HTTP_CLIENT_TIMEOUT', 10),
+    connect_timeout=getattr(app.state, 'HTTP_CLIENT_CONNECT_TIMEOUT', 5),
+    max_connections=getattr(app.state, 'HTTP_CLIENT_MAX_CONNECTIONS', 100),
+    max_keepalive_connections=getattr(app.state, 'HTTP_CLIENT_MAX_KEEPALIVE_CONNECTIONS', 20),
+    keepalive_expiry=getattr(app.state, 'HTTP_CLIENT_KEEPALIVE_EXPIRY', 30),
+    http2=getattr(app.state, 'HTTP_CLIENT_HTTP2', True),
+    max_concurrency_per_host=getattr(app.state, 'HTTP_CLIENT_MAX_CONCURRENCY_PER_HOST', 50),
+    retries=getattr(app.state, 'HTTP_CLIENT_RETRIES', 2),
+    backoff_base=getattr(app.state, 'HTTP_CLIENT_BACKOFF_BASE', 0.1),
+    backoff_max=getattr(app.state, 'HTTP_CLIENT_BACKOFF_MAX', 2),
+)
+startup_hooks.append(http_client.start)
+shutdown_hooks.append(http_client.close)
@@ -1,6 +1,7 @@
 
 
 from app_instance import app, logger
+from app.client.http_client import http_client
 
 
 
@@ -9,14 +10,21 @@ from app_instance import app, logger
 # Another method would be to create a payment intent
 # Another method to retrieve a customer
 # And so on
+# Make the calls through http_client, which reuses connections to each host and retries idempotent requests
 
 
-def method_that_calls_3rd_party_api_1():
+async def method_that_calls_3rd_party_api_1():
     logger.info("Some logic here")
+    response = await http_client.get("https://api.example.com/customers/customer_id")
+    response.raise_for_status()
+    return response.json()
 
 
-def method_that_calls_3rd_party_api_2():
+async def method_that_calls_3rd_party_api_2():
     logger.info("Some logic here")
+    response = await http_client.post("https://api.example.com/payment_intents", json={"amount": 100})
+    response.raise_for_status()
+    return response.json()
 
 
 def method_that_calls_3rd_party_api_3():
@@ -1,31 +1,178 @@
+import asyncio
 from concurrent import futures
 
 import google
 import grpc
+from app_instance import app, logger
+from app.grpc.response_cache import ResponseCache
 from app.proto.gen import BaseModel1_pb2_grpc, BaseModel1_pb2
+from app.service.bulk_ingest import BulkIngestor
+from app.utils.custom_thread_pool_executor import PropagatingThreadPoolExecutor
+
+
+def process_object_examples(objects, data):
+    """Handles a chunk of ingested ObjectExample, 'data' holds their decoded jsonData (None if empty or invalid)."""
+    logger.debug(f"Ingested {len(objects)} objects")
+
+
+object_example_ingestor = BulkIngestor(
+    process_object_examples,
+    chunk_size=getattr(app.state, 'BULK_INGEST_CHUNK_SIZE', 1000),
+    process_pool_min_items=getattr(app.state, 'BULK_INGEST_PROCESS_POOL_MIN_ITEMS', 0),
+    max_processes=getattr(app.state, 'BULK_INGEST_MAX_PROCESSES', 2),
+)
+
+# Responses of ExampleCall, a pure lookup, tagged with the userId
+example_call_cache = ResponseCache(
+    max_entries=getattr(app.state, 'GRPC_RESPONSE_CACHE_MAX_ENTRIES', 10000),
+    ttl=getattr(app.state, 'GRPC_RESPONSE_CACHE_TTL', 60),
+)
+
+
+def invalidate_user(user_id):
+    """Drops the cached ExampleCall responses of 'user_id', call it whenever the user's transactions change."""
+    example_call_cache.invalidate(tag=user_id)
 
 
 class BaseModel1GRPCServiceServicer(BaseModel1_pb2_grpc.BaseModel1GRPCServiceServicer):
 
-    def ExampleCall(self, request, context):
+    def lookup_transactions(self, request):
+        """The lookup behind ExampleCall, its responses are cached by example_call_cache."""
         response = BaseModel1_pb2.ExampleCallResponse(
+            userId=request.userId,
             transactionsFound=True,
             transactionsCount=42
         )
         return response
 
+    def ExampleCall(self, request, context):
+        return example_call_cache.get_or_compute('ExampleCall', request, self.lookup_transactions, tag=request.userId)
+
+    def ExampleCallStream(self, request, context):
+        for user_id in request.userIds:
+            yield self.ExampleCall(BaseModel1_pb2.ExampleCallRequest(userId=user_id, otherField=request.otherField), context)
+
     def ExampleCallReturnsEmpty(self, request, context):
+        invalid = object_example_ingestor.ingest(request.listOfObjectExample)
+        if invalid:
+            logger.warning(f"{invalid} of {len(request.listOfObjectExample)} objects with invalid jsonData")
         return google.protobuf.empty_pb2.Empty()
 
+    def IngestObjectExamples(self, request_iterator, context):
+        received, invalid = object_example_ingestor.ingest_stream(request.listOfObjectExample for request in request_iterator)
+        if invalid:
+            logger.warning(f"{invalid} of {received} streamed objects with invalid jsonData")
+        return BaseModel1_pb2.IngestObjectExamplesResponse(objectsReceived=received, objectsInvalid=invalid)
+
+
+class AsyncBaseModel1GRPCServiceServicer(BaseModel1GRPCServiceServicer):
+    """Servicer of the grpc.aio server. Its handlers run on the event loop, so they await I/O instead of blocking."""
+
+    async def lookup_transactions(self, request):
+        return super().lookup_transactions(request)
+
+    async def ExampleCall(self, request, context):
+        return await example_call_cache.aget_or_compute('ExampleCall', request, self.lookup_transactions, tag=request.userId)
+
+    async def ExampleCallStream(self, request, context):
+        for user_id in request.userIds:
+            yield await self.ExampleCall(BaseModel1_pb2.ExampleCallRequest(userId=user_id, otherField=request.otherField), context)
+
+    async def ExampleCallReturnsEmpty(self, request, context):
+        # Decoding a batch is CPU work, kept off the event loop
+        return await asyncio.to_thread(super().ExampleCallReturnsEmpty, request, context)
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    BaseModel1_pb2_grpc.add_BaseModel1GRPCServiceServicer_to_server(BaseModel1GRPCServiceServicer(), server)
-    server.add_insecure_port('[::]:50051')
+    async def IngestObjectExamples(self, request_iterator, context):
+        received, invalid = await object_example_ingestor.ingest_stream_async(request.listOfObjectExample async for request in request_iterator)
+        if invalid:
+            logger.warning(f"{invalid} of {received} streamed objects with invalid jsonData")
+        return BaseModel1_pb2.IngestObjectExamplesResponse(objectsReceived=received, objectsInvalid=invalid)
+
+
+COMPRESSION = {'none': grpc.Compression.NoCompression, 'gzip': grpc.Compression.Gzip, 'deflate': grpc.Compression.Deflate}
+
+# Set by serve() and start_aio(), used by stop() and stop_aio()
+server = None
+executor = None
+aio_server = None
+
+
+def server_options():
+    """Channel arguments of the server, from the grpc config."""
+    return [
+        ('grpc.keepalive_time_ms', getattr(app.state, 'GRPC_KEEPALIVE_TIME_MS', 7200000)),
+        ('grpc.keepalive_timeout_ms', getattr(app.state, 'GRPC_KEEPALIVE_TIMEOUT_MS', 20000)),
+        ('grpc.keepalive_permit_without_calls', int(getattr(app.state, 'GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS', False))),
+        ('grpc.http2.min_ping_interval_without_data_ms', getattr(app.state, 'GRPC_MIN_CLIENT_PING_INTERVAL_MS', 300000)),
+        ('grpc.max_receive_message_length', getattr(app.state, 'GRPC_MAX_RECEIVE_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+        ('grpc.max_send_message_length', getattr(app.state, 'GRPC_MAX_SEND_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+        ('grpc.so_reuseport', int(getattr(app.state, 'GRPC_SO_REUSEPORT', True))),
+    ]
+
+
+def server_address():
+    return f"[::]:{getattr(app.state, 'GRPC_PORT', 50051)}"
+
+
+def serve(servicer=None):
+    """Runs the gRPC server on its own thread pool and blocks until it stops."""
+    global server, executor
+    max_workers = getattr(app.state, 'GRPC_MAX_WORKERS', 10)
+    max_queue_size = getattr(app.state, 'GRPC_EXECUTOR_MAX_QUEUE_SIZE', 100)
+    maximum_concurrent_rpcs = max_workers + max_queue_size
+    if getattr(app.state, 'GRPC_MAXIMUM_CONCURRENT_RPCS', 0):
+        maximum_concurrent_rpcs = min(maximum_concurrent_rpcs, app.state.GRPC_MAXIMUM_CONCURRENT_RPCS)
+    # No queue bound on the executor: the server rejects RPCs beyond maximum_concurrent_rpcs with RESOURCE_EXHAUSTED
+    # before they reach it, so its queue holds at most max_queue_size of them. A bound of its own, released when a task's
+    # future completes rather than when gRPC counts the RPC as done, could block the server's polling thread in submit()
+    executor = PropagatingThreadPoolExecutor(max_workers=max_workers, name='grpc-server')
+    server = grpc.server(
+        executor,
+        options=server_options(),
+        compression=COMPRESSION[getattr(app.state, 'GRPC_COMPRESSION', 'none')],
+        maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+    )
+    BaseModel1_pb2_grpc.add_BaseModel1GRPCServiceServicer_to_server(servicer or BaseModel1GRPCServiceServicer(), server)
+    server.add_insecure_port(server_address())
+    logger.info(f"gRPC server listening on {server_address()} with {max_workers} workers, up to {maximum_concurrent_rpcs} RPCs at once")
     server.start()
     server.wait_for_termination()
 
 
+def stop(grace=30):
+    """Stops accepting RPCs and gives the ones in progress up to 'grace' seconds to finish."""
+    if server is not None:
+        server.stop(grace).wait()
+    if executor is not None:
+        drained = executor.drain(grace)
+        logger.info(f"gRPC server executor drained: {drained}, metrics: {executor.metrics()}")
+
+
+async def start_aio(servicer=None):
+    """Starts a grpc.aio server on the running event loop, uvicorn's when called from the app's startup.
+
+    RPCs are coroutines on the loop rather than jobs on a thread pool, so their concurrency is only
+    capped by maximum_concurrent_rpcs.
+    """
+    global aio_server
+    maximum_concurrent_rpcs = getattr(app.state, 'GRPC_MAXIMUM_CONCURRENT_RPCS', 0) or None
+    aio_server = grpc.aio.server(
+        options=server_options(),
+        compression=COMPRESSION[getattr(app.state, 'GRPC_COMPRESSION', 'none')],
+        maximum_concurrent_rpcs=maximum_concurrent_rpcs,
+    )
+    BaseModel1_pb2_grpc.add_BaseModel1GRPCServiceServicer_to_server(servicer or AsyncBaseModel1GRPCServiceServicer(), aio_server)
+    aio_server.add_insecure_port(server_address())
+    logger.info(f"gRPC aio server listening on {server_address()}, up to {maximum_concurrent_rpcs or 'unlimited'} RPCs at once")
+    await aio_server.start()
+
+
+async def stop_aio(grace=30):
+    """Stops accepting RPCs and gives the ones in progress up to 'grace' seconds to finish."""
+    if aio_server is not None:
+        await aio_server.stop(grace)
+
+
 # def start_grpc_server():
 #     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
 #     BaseModel1_pb2_grpc.add_BaseModel1GRPCServiceServicer_to_server(BaseModel1GRPCServiceServicer(), server)
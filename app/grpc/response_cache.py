@@ -0,0 +1,125 @@
+# response_cache.py
+
+import asyncio
+import concurrent.futures
+import threading
+
+from app.utils.lru_cache import LRUCache
+
+
+class ResponseCache:
+    """Caches the responses of pure lookup RPCs, keyed by the method and the request's serialized bytes.
+
+    Responses are kept for 'ttl' seconds, up to 'max_entries'. Concurrent calls with the same request
+    share one computation (single-flight). Each entry can carry a tag, like the userId it is about,
+    so invalidate(tag=...) drops every response about it when the underlying data changes. A response
+    computed while an invalidation happened isn't stored, and calls arriving after the invalidation
+    don't join it, so a stale result never outlives it.
+    Cached responses are shared between calls and must not be modified.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.ttl = ttl
+        self.coalesced = 0
+        self._cache = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._in_flight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Async computations, referenced until they finish
+        self._tasks = set()
+
+    def _key(self, method, request, tag):
+        return method, tag, request.SerializeToString(deterministic=True)
+
+    def _begin(self, key):
+        """Returns (future, generation): the computation to wait for, and the generation it has to run in
+        when this call has to run it, None when it joined one in flight."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, None
+            future = self._in_flight[key] = concurrent.futures.Future()
+            return future, self._generation
+
+    def _finish(self, key, future, generation, response=None, error=None):
+        with self._lock:
+            # Unless invalidate() detached it, and a later call started another computation
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if error is None and generation == self._generation:
+                self._cache.set(key, response)
+        if future.cancelled():
+            return
+        if error is None:
+            future.set_result(response)
+        else:
+            future.set_exception(error)
+
+    def get_or_compute(self, method, request, compute, tag=None):
+        """Returns the cached response to 'request', or compute(request) shared with the identical calls in flight."""
+        if not self.ttl:
+            return compute(request)
+        key = self._key(method, request, tag)
+        response = self._cache.get(key)
+        if response is not None:
+            return response
+        future, generation = self._begin(key)
+        if generation is None:
+            return future.result()
+        try:
+            response = compute(request)
+        except BaseException as e:
+            # Whatever it is, or the calls waiting for this one would wait forever
+            self._finish(key, future, generation, error=e)
+            raise
+        self._finish(key, future, generation, response)
+        return response
+
+    async def aget_or_compute(self, method, request, compute, tag=None):
+        """get_or_compute() for a coroutine function 'compute', waiting without blocking the event loop."""
+        if not self.ttl:
+            return await compute(request)
+        key = self._key(method, request, tag)
+        response = self._cache.get(key)
+        if response is not None:
+            return response
+        future, generation = self._begin(key)
+        if generation is not None:
+            # In a task of its own, so the computation outlives the call that started it being cancelled
+            task = asyncio.ensure_future(self._acompute(key, future, generation, compute, request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        # Shielded: a call cancelled (deadline, disconnect) mustn't cancel the computation shared with the others
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _acompute(self, key, future, generation, compute, request):
+        try:
+            response = await compute(request)
+        except BaseException as e:
+            # Including a cancellation, or the calls waiting for this one would never get an answer
+            self._finish(key, future, generation, error=e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        self._finish(key, future, generation, response)
+
+    def invalidate(self, method=None, tag=None):
+        """Drops the responses of 'method' and/or about 'tag', all of them without either."""
+        with self._lock:
+            self._generation += 1
+            # Calls from now on start a computation of their own instead of joining one started before
+            for key in list(self._in_flight):
+                if (method is None or key[0] == method) and (tag is None or key[1] == tag):
+                    del self._in_flight[key]
+        if method is None and tag is None:
+            self._cache.clear()
+            return
+        for key in self._cache.keys():
+            if (method is None or key[0] == method) and (tag is None or key[1] == tag):
+                self._cache.pop(key)
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {**self._cache.stats(), "coalesced": self.coalesced, "in_flight": in_flight}
@@ -1,6 +1,9 @@
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+from app.utils import json_codec
 
 class ErrorDetail:
+    __slots__ = ("code", "message")
+
     def __init__(self, code, message):
         self.code = code
         self.message = message
@@ -12,10 +15,12 @@ class ErrorDetail:
         }
 
 class ApiErrorResponse:
+    __slots__ = ("errors",)
+
     def __init__(self, errors):
         self.errors = errors
 
     def to_response(self):
         response_content = {"errors": [error.to_dict() for error in self.errors]}
         status_code = self.errors[0].code if self.errors else 500
-        return JSONResponse(content=response_content, status_code=status_code, headers={"Access-Control-Allow-Origin": "*"})
+        return Response(content=json_codec.dumps(response_content), status_code=status_code, media_type="application/json", headers={"Access-Control-Allow-Origin": "*"})
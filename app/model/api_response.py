@@ -1,23 +1,12 @@
-from collections import OrderedDict
-from fastapi.responses import JSONResponse
-import datetime
-import json
-
-
-def serialize_datetime(obj):
-    """
-    Custom function to serialize datetime.datetime objects.
-    Args:
-        obj: object to be JSON serialized
-    Returns:
-        JSON serializable version of obj
-    """
-    if isinstance(obj, datetime.datetime):
-        return obj.isoformat()
-    raise TypeError("Type not serializable")
+from fastapi.responses import Response, StreamingResponse
+from app.utils import json_codec
+from app.utils.json_codec import serialize_datetime
+
 
 class ApiResponse:
-    def __init__(self, timestamp, request_id, query_id, user_id, session_id, current_page, page_size, total_pages, total_elements, data):
+    __slots__ = ("timestamp", "request_id", "query_id", "user_id", "session_id", "current_page", "page_size", "total_pages", "total_elements", "data", "next_cursor")
+
+    def __init__(self, timestamp, request_id, query_id, user_id, session_id, current_page, page_size, total_pages, total_elements, data, next_cursor=None):
         self.timestamp = timestamp
         self.request_id = request_id
         self.query_id = query_id
@@ -28,25 +17,70 @@ class ApiResponse:
         self.total_pages = total_pages
         self.total_elements = total_elements
         self.data = data
+        self.next_cursor = next_cursor
 
     def to_dict(self):
-        return OrderedDict([
-            ("timestamp", self.timestamp),
-            ("requestId", self.request_id),
-            ("queryId", self.query_id),
-            ("userId", self.user_id),
-            ("sessionId", self.session_id),
-            ("currentPage", self.current_page),
-            ("pageSize", self.page_size),
-            ("totalPages", self.total_pages),
-            ("totalElements", self.total_elements),
-            ("data", self.data)
-        ])
+        envelope = {
+            "timestamp": self.timestamp,
+            "requestId": self.request_id,
+            "queryId": self.query_id,
+            "userId": self.user_id,
+            "sessionId": self.session_id,
+            "currentPage": self.current_page,
+            "pageSize": self.page_size,
+            "totalPages": self.total_pages,
+            "totalElements": self.total_elements,
+        }
+        # Only responses paginated with a cursor carry one
+        if self.next_cursor is not None:
+            envelope["nextCursor"] = self.next_cursor
+        envelope["data"] = self.data
+        return envelope
 
     def to_response(self):
-        # Serialize the response dictionary to JSON, using the custom datetime serializer
-        json_response = json.dumps(self.to_dict(), default=serialize_datetime)
-        return JSONResponse(content=json.loads(json_response), headers={"Access-Control-Allow-Origin": "*"})
+        # Serialize the response straight to bytes, using the custom datetime serializer, so the payload is encoded only once
+        content = json_codec.dumps(self.to_dict(), default=serialize_datetime)
+        return Response(content=content, media_type="application/json", headers={"Access-Control-Allow-Origin": "*"})
+
+    def to_streaming_response(self, chunk_size=500):
+        # 'data' is an iterator or async iterator, its items are sent in chunks of 'chunk_size' after the rest of the envelope
+        if hasattr(self.data, "__aiter__"):
+            body = self._aiter_body(chunk_size)
+        else:
+            body = self._iter_body(chunk_size)
+        return StreamingResponse(body, media_type="application/json", headers={"Access-Control-Allow-Origin": "*"})
 
+    def _envelope_head(self):
+        # 'data' is the last field of the envelope, so everything before it can be sent upfront
+        envelope = self.to_dict()
+        del envelope["data"]
+        return json_codec.dumps(envelope, default=serialize_datetime)[:-1] + b',"data":['
 
+    def _iter_body(self, chunk_size):
+        # Sync generator, Starlette iterates it in a thread pool so slow sources don't block the event loop
+        yield self._envelope_head()
+        separator = b""
+        chunk = []
+        for item in self.data:
+            chunk.append(json_codec.dumps(item, default=serialize_datetime))
+            if len(chunk) >= chunk_size:
+                yield separator + b",".join(chunk)
+                separator = b","
+                chunk = []
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]}"
 
+    async def _aiter_body(self, chunk_size):
+        yield self._envelope_head()
+        separator = b""
+        chunk = []
+        async for item in self.data:
+            chunk.append(json_codec.dumps(item, default=serialize_datetime))
+            if len(chunk) >= chunk_size:
+                yield separator + b",".join(chunk)
+                separator = b","
+                chunk = []
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]}"
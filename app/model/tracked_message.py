@@ -0,0 +1,14 @@
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True)
+class TrackedMessage:
+    """Pub/Sub message carrying the tracking ids of the request that produced it.
+
+    Decoded from the JSON payload, or from the TrackedMessage protobuf of app/proto, by
+    app.pubsub.message_decoder. Keys of the payload that aren't fields here are ignored.
+    """
+    user_id: str
+    request_id: str
+    session_id: str
+    query_id: str
@@ -15,7 +15,7 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import empty_pb2 as google_dot_protobuf_dot_empty__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10\x42\x61seModel1.proto\x12\rgoBaseService\x1a\x1bgoogle/protobuf/empty.proto\"8\n\x12\x45xampleCallRequest\x12\x0e\n\x06userId\x18\x01 \x01(\t\x12\x12\n\notherField\x18\x02 \x01(\t\"K\n\x13\x45xampleCallResponse\x12\x19\n\x11transactionsFound\x18\x01 \x01(\x08\x12\x19\n\x11transactionsCount\x18\x02 \x01(\x03\"[\n\x1e\x45xampleCallReturnsEmptyRequest\x12\x39\n\x13listOfObjectExample\x18\x01 \x03(\x0b\x32\x1c.goBaseService.ObjectExample\"s\n\rObjectExample\x12\x0e\n\x06userId\x18\x01 \x01(\t\x12\x10\n\x08reportId\x18\x02 \x01(\t\x12\x15\n\rtransactionId\x18\x03 \x01(\t\x12\x10\n\x08jsonData\x18\x04 \x01(\t\x12\x17\n\x0ftransactionDate\x18\x05 \x01(\t2\xd3\x01\n\x15\x42\x61seModel1GRPCService\x12V\n\x0b\x45xampleCall\x12!.goBaseService.ExampleCallRequest\x1a\".goBaseService.ExampleCallResponse\"\x00\x12\x62\n\x17\x45xampleCallReturnsEmpty\x12-.goBaseService.ExampleCallReturnsEmptyRequest\x1a\x16.google.protobuf.Empty\"\x00\x42\x10Z\x0e/proto/gen;genb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10\x42\x61seModel1.proto\x12\rgoBaseService\x1a\x1bgoogle/protobuf/empty.proto\"8\n\x12\x45xampleCallRequest\x12\x0e\n\x06userId\x18\x01 \x01(\t\x12\x12\n\notherField\x18\x02 \x01(\t\"[\n\x13\x45xampleCallResponse\x12\x19\n\x11transactionsFound\x18\x01 \x01(\x08\x12\x19\n\x11transactionsCount\x18\x02 \x01(\x03\x12\x0e\n\x06userId\x18\x03 \x01(\t\"?\n\x18\x45xampleCallStreamRequest\x12\x0f\n\x07userIds\x18\x01 \x03(\t\x12\x12\n\notherField\x18\x02 \x01(\t\"[\n\x1e\x45xampleCallReturnsEmptyRequest\x12\x39\n\x13listOfObjectExample\x18\x01 \x03(\x0b\x32\x1c.goBaseService.ObjectExample\"O\n\x1cIngestObjectExamplesResponse\x12\x17\n\x0fobjectsReceived\x18\x01 \x01(\x03\x12\x16\n\x0eobjectsInvalid\x18\x02 \x01(\x03\"s\n\rObjectExample\x12\x0e\n\x06userId\x18\x01 \x01(\t\x12\x10\n\x08reportId\x18\x02 \x01(\t\x12\x15\n\rtransactionId\x18\x03 \x01(\t\x12\x10\n\x08jsonData\x18\x04 \x01(\t\x12\x17\n\x0ftransactionDate\x18\x05 \x01(\t\"[\n\x0eTrackedMessage\x12\x0f\n\x07user_id\x18\x01 \x01(\t\x12\x12\n\nrequest_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\x12\x10\n\x08query_id\x18\x04 \x01(\t2\xb1\x03\n\x15\x42\x61seModel1GRPCService\x12V\n\x0b\x45xampleCall\x12!.goBaseService.ExampleCallRequest\x1a\".goBaseService.ExampleCallResponse\"\x00\x12\x64\n\x11\x45xampleCallStream\x12\'.goBaseService.ExampleCallStreamRequest\x1a\".goBaseService.ExampleCallResponse\"\x00\x30\x01\x12\x62\n\x17\x45xampleCallReturnsEmpty\x12-.goBaseService.ExampleCallReturnsEmptyRequest\x1a\x16.google.protobuf.Empty\"\x00\x12v\n\x14IngestObjectExamples\x12-.goBaseService.ExampleCallReturnsEmptyRequest\x1a+.goBaseService.IngestObjectExamplesResponse\"\x00(\x01\x42\x10Z\x0e/proto/gen;genb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -26,11 +26,17 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_EXAMPLECALLREQUEST']._serialized_start=64
   _globals['_EXAMPLECALLREQUEST']._serialized_end=120
   _globals['_EXAMPLECALLRESPONSE']._serialized_start=122
-  _globals['_EXAMPLECALLRESPONSE']._serialized_end=197
-  _globals['_EXAMPLECALLRETURNSEMPTYREQUEST']._serialized_start=199
-  _globals['_EXAMPLECALLRETURNSEMPTYREQUEST']._serialized_end=290
-  _globals['_OBJECTEXAMPLE']._serialized_start=292
-  _globals['_OBJECTEXAMPLE']._serialized_end=407
-  _globals['_BASEMODEL1GRPCSERVICE']._serialized_start=410
-  _globals['_BASEMODEL1GRPCSERVICE']._serialized_end=621
+  _globals['_EXAMPLECALLRESPONSE']._serialized_end=213
+  _globals['_EXAMPLECALLSTREAMREQUEST']._serialized_start=215
+  _globals['_EXAMPLECALLSTREAMREQUEST']._serialized_end=278
+  _globals['_EXAMPLECALLRETURNSEMPTYREQUEST']._serialized_start=280
+  _globals['_EXAMPLECALLRETURNSEMPTYREQUEST']._serialized_end=371
+  _globals['_INGESTOBJECTEXAMPLESRESPONSE']._serialized_start=373
+  _globals['_INGESTOBJECTEXAMPLESRESPONSE']._serialized_end=452
+  _globals['_OBJECTEXAMPLE']._serialized_start=454
+  _globals['_OBJECTEXAMPLE']._serialized_end=569
+  _globals['_TRACKEDMESSAGE']._serialized_start=571
+  _globals['_TRACKEDMESSAGE']._serialized_end=662
+  _globals['_BASEMODEL1GRPCSERVICE']._serialized_start=665
+  _globals['_BASEMODEL1GRPCSERVICE']._serialized_end=1098
 # @@protoc_insertion_point(module_scope)
@@ -45,11 +45,21 @@ class BaseModel1GRPCServiceStub(object):
                 request_serializer=BaseModel1__pb2.ExampleCallRequest.SerializeToString,
                 response_deserializer=BaseModel1__pb2.ExampleCallResponse.FromString,
                 _registered_method=True)
+        self.ExampleCallStream = channel.unary_stream(
+                '/goBaseService.BaseModel1GRPCService/ExampleCallStream',
+                request_serializer=BaseModel1__pb2.ExampleCallStreamRequest.SerializeToString,
+                response_deserializer=BaseModel1__pb2.ExampleCallResponse.FromString,
+                _registered_method=True)
         self.ExampleCallReturnsEmpty = channel.unary_unary(
                 '/goBaseService.BaseModel1GRPCService/ExampleCallReturnsEmpty',
                 request_serializer=BaseModel1__pb2.ExampleCallReturnsEmptyRequest.SerializeToString,
                 response_deserializer=google_dot_protobuf_dot_empty__pb2.Empty.FromString,
                 _registered_method=True)
+        self.IngestObjectExamples = channel.stream_unary(
+                '/goBaseService.BaseModel1GRPCService/IngestObjectExamples',
+                request_serializer=BaseModel1__pb2.ExampleCallReturnsEmptyRequest.SerializeToString,
+                response_deserializer=BaseModel1__pb2.IngestObjectExamplesResponse.FromString,
+                _registered_method=True)
 
 
 class BaseModel1GRPCServiceServicer(object):
@@ -61,12 +71,27 @@ class BaseModel1GRPCServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def ExampleCallStream(self, request, context):
+        """Answers ExampleCall for many userIds over one stream, one response per userId in the same order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def ExampleCallReturnsEmpty(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def IngestObjectExamples(self, request_iterator, context):
+        """Client streaming variant of ExampleCallReturnsEmpty for large volumes: each message carries a batch of objects,
+        so millions of objects can be sent without one huge message
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_BaseModel1GRPCServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -75,11 +100,21 @@ def add_BaseModel1GRPCServiceServicer_to_server(servicer, server):
                     request_deserializer=BaseModel1__pb2.ExampleCallRequest.FromString,
                     response_serializer=BaseModel1__pb2.ExampleCallResponse.SerializeToString,
             ),
+            'ExampleCallStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.ExampleCallStream,
+                    request_deserializer=BaseModel1__pb2.ExampleCallStreamRequest.FromString,
+                    response_serializer=BaseModel1__pb2.ExampleCallResponse.SerializeToString,
+            ),
             'ExampleCallReturnsEmpty': grpc.unary_unary_rpc_method_handler(
                     servicer.ExampleCallReturnsEmpty,
                     request_deserializer=BaseModel1__pb2.ExampleCallReturnsEmptyRequest.FromString,
                     response_serializer=google_dot_protobuf_dot_empty__pb2.Empty.SerializeToString,
             ),
+            'IngestObjectExamples': grpc.stream_unary_rpc_method_handler(
+                    servicer.IngestObjectExamples,
+                    request_deserializer=BaseModel1__pb2.ExampleCallReturnsEmptyRequest.FromString,
+                    response_serializer=BaseModel1__pb2.IngestObjectExamplesResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'goBaseService.BaseModel1GRPCService', rpc_method_handlers)
@@ -118,6 +153,33 @@ class BaseModel1GRPCService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def ExampleCallStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/goBaseService.BaseModel1GRPCService/ExampleCallStream',
+            BaseModel1__pb2.ExampleCallStreamRequest.SerializeToString,
+            BaseModel1__pb2.ExampleCallResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def ExampleCallReturnsEmpty(request,
             target,
@@ -144,3 +206,30 @@ class BaseModel1GRPCService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def IngestObjectExamples(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/goBaseService.BaseModel1GRPCService/IngestObjectExamples',
+            BaseModel1__pb2.ExampleCallReturnsEmptyRequest.SerializeToString,
+            BaseModel1__pb2.IngestObjectExamplesResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,63 @@
+# adaptive_worker_tuner.py
+
+import threading
+
+from app_instance import logger
+
+
+class AdaptiveWorkerTuner:
+    """Grows the workers of a PropagatingThreadPoolExecutor while the work is backing up and stays fast.
+
+    Every 'interval' seconds the tuner looks at the tasks that finished since the last check. When the
+    pool was saturated (every worker busy or tasks queued) and their average run time stayed under
+    'target_latency' seconds, it adds 'step' workers, up to 'max_workers_limit'. Slower tasks mean the
+    extra concurrency is hurting whatever the workers call, so the pool is left as is. It never shrinks.
+    """
+
+    def __init__(self, executor, max_workers_limit, target_latency, interval=10, step=1):
+        self.executor = executor
+        self.max_workers_limit = max_workers_limit
+        self.target_latency = target_latency
+        self.interval = interval
+        self.step = step
+        self._last_completed = 0
+        self._last_run_time = 0.0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._last_completed = self.executor.completed
+        self._last_run_time = self.executor.run_time_total
+        self._thread = threading.Thread(target=self._run, name=f"{self.executor.name}-tuner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.tune()
+
+    def tune(self):
+        """Runs one check and returns the worker count afterwards."""
+        metrics = self.executor.metrics()
+        run_time_total = self.executor.run_time_total
+        completed = metrics["completed"] - self._last_completed
+        run_time = run_time_total - self._last_run_time
+        self._last_completed = metrics["completed"]
+        self._last_run_time = run_time_total
+
+        max_workers = metrics["max_workers"]
+        if completed == 0 or max_workers >= self.max_workers_limit:
+            return max_workers
+        saturated = metrics["queue_depth"] > 0 or metrics["active_workers"] >= max_workers
+        latency = run_time / completed
+        if saturated and latency < self.target_latency:
+            new_max_workers = min(max_workers + self.step, self.max_workers_limit)
+            self.executor.grow(new_max_workers)
+            logger.info(f"Growing {self.executor.name} from {max_workers} to {new_max_workers} workers, "
+                        f"average latency {latency * 1000:.1f}ms under the {self.target_latency * 1000:.0f}ms target")
+            return new_max_workers
+        return max_workers
@@ -0,0 +1,144 @@
+# asyncio_scheduler.py
+
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import queue
+import threading
+
+from google.cloud import pubsub_v1
+
+from app_instance import logger
+
+
+def is_coroutine_callback(callback):
+    return inspect.iscoroutinefunction(callback) or inspect.iscoroutinefunction(getattr(callback, '__call__', None))
+
+
+def unwrap_callback(callback):
+    """Returns (user callback, on_callback_error) of a callback the subscriber wrapped, (callback, None) for any other.
+
+    The subscriber hands the scheduler partial(_wrap_callback_errors, callback, on_callback_error), which
+    calls the callback without awaiting it: a coroutine callback has to be taken out of it to run.
+    """
+    if (isinstance(callback, functools.partial) and getattr(callback.func, '__name__', None) == '_wrap_callback_errors'
+            and len(callback.args) == 2 and not callback.keywords):
+        return callback.args
+    return callback, None
+
+
+class AsyncioScheduler(pubsub_v1.subscriber.scheduler.Scheduler):
+    """Pub/Sub scheduler that runs each message callback as a task on an asyncio event loop.
+
+    Coroutine callbacks run on the loop, at most 'max_concurrency' at a time; messages over the
+    limit wait for a slot without holding a thread. Sync callbacks keep working: they run on
+    'executor' (the loop's default executor if None), within the same concurrency limit.
+
+    Without 'loop', the scheduler starts a dedicated loop in its own thread and stops it on
+    shutdown. A shared loop, like uvicorn's, is used as is and left running.
+    """
+
+    def __init__(self, loop=None, max_concurrency=1000, executor=None):
+        self._queue = queue.Queue()
+        self._owns_loop = loop is None
+        self._loop = loop or asyncio.new_event_loop()
+        self._executor = executor
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._closing = False
+        # Futures of the dispatched callbacks: waiting for a slot (with their message) and running
+        self._waiting = {}
+        self._running = set()
+        self._loop_thread = None
+        if self._owns_loop:
+            self._loop_thread = threading.Thread(target=self._loop.run_forever, name="pubsub-asyncio", daemon=True)
+            self._loop_thread.start()
+
+    @property
+    def queue(self):
+        return self._queue
+
+    def schedule(self, callback, *args, **kwargs):
+        with self._lock:
+            if self._closing:
+                logger.warning("Scheduling a Pub/Sub callback after the scheduler shut down")
+                return
+            done = concurrent.futures.Future()
+            self._waiting[done] = args[0] if args else None
+        asyncio.run_coroutine_threadsafe(self._dispatch(done, callback, args, kwargs), self._loop)
+
+    async def _dispatch(self, done, callback, args, kwargs):
+        try:
+            async with self._semaphore:
+                with self._lock:
+                    # Messages still waiting at shutdown were handed back to the subscriber to be nacked
+                    if done not in self._waiting:
+                        return
+                    del self._waiting[done]
+                    self._running.add(done)
+                try:
+                    user_callback, on_callback_error = unwrap_callback(callback)
+                    if is_coroutine_callback(user_callback):
+                        await self._run_coroutine_callback(user_callback, on_callback_error, args, kwargs)
+                    else:
+                        await self._loop.run_in_executor(self._executor, functools.partial(callback, *args, **kwargs))
+                except Exception as e:
+                    logger.error(f"Error in Pub/Sub callback: {type(e).__name__} – {e}")
+                finally:
+                    with self._lock:
+                        self._running.discard(done)
+        finally:
+            done.set_result(None)
+
+    @staticmethod
+    async def _run_coroutine_callback(callback, on_callback_error, args, kwargs):
+        if on_callback_error is None:
+            await callback(*args, **kwargs)
+            return
+        # What _wrap_callback_errors does for sync callbacks: nack the message and report the error to the subscriber
+        message = args[0]
+        try:
+            await callback(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Pub/Sub callback failed on message {message.message_id}, nacking it: {type(e).__name__} – {e}")
+            message.nack()
+            on_callback_error(e)
+
+    def shutdown(self, await_msg_callbacks=False):
+        """Stops dispatching and returns the messages that were waiting for a slot.
+
+        With await_msg_callbacks, blocks until the running callbacks finish. A dedicated loop is
+        stopped once they have.
+        """
+        with self._lock:
+            self._closing = True
+            dropped_messages = [message for message in self._waiting.values() if message is not None]
+            # The dropped tasks still have to get a slot to see they were dropped, before a dedicated loop can stop
+            dispatched = list(self._waiting) + list(self._running)
+            self._waiting.clear()
+            running = list(self._running)
+        if self._owns_loop:
+            if await_msg_callbacks:
+                self._stop_loop(dispatched)
+            else:
+                threading.Thread(target=self._stop_loop, args=(dispatched,), name="pubsub-asyncio-stop", daemon=True).start()
+        elif await_msg_callbacks:
+            concurrent.futures.wait(running)
+        return dropped_messages
+
+    def drain(self, timeout=None):
+        """Waits up to 'timeout' seconds for the running callbacks, returns True when they all finished."""
+        with self._lock:
+            running = list(self._running)
+        _, not_done = concurrent.futures.wait(running, timeout)
+        return not not_done
+
+    def _stop_loop(self, dispatched):
+        concurrent.futures.wait(dispatched)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self):
+        with self._lock:
+            return {"max_concurrency": self.max_concurrency, "waiting": len(self._waiting), "running": len(self._running)}
@@ -0,0 +1,97 @@
+# batching_consumer.py
+
+import threading
+import time
+
+from app_instance import logger
+
+
+class BatchingConsumer:
+    """Subscriber callback that collects messages and hands them to 'batch_handler' as lists.
+
+    A batch is handed over when it reaches 'max_items' messages, on the worker thread that added
+    the last one, or 'max_latency_ms' after its first message arrived, on the flusher thread.
+    The handler returns one result per message, in order: truthy to ack, falsy to nack so it gets
+    redelivered. Returning None acks the whole batch, raising nacks it.
+
+    Messages waiting in a batch count against the subscriber's flow control, so max_messages
+    should be at least max_items or batches are only ever flushed by the timer.
+    """
+
+    def __init__(self, batch_handler, max_items=100, max_latency_ms=50):
+        self.batch_handler = batch_handler
+        self.max_items = max_items
+        self.max_latency = max_latency_ms / 1000
+        self.batches = 0
+        self.acked = 0
+        self.nacked = 0
+        self._pending = []
+        self._deadline = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flusher = threading.Thread(target=self._run, name="pubsub-batch-flusher", daemon=True)
+        self._flusher.start()
+
+    def __call__(self, message):
+        with self._condition:
+            if self._closed:
+                message.nack()
+                return
+            self._pending.append(message)
+            if len(self._pending) == 1:
+                self._deadline = time.monotonic() + self.max_latency
+                self._condition.notify()
+            if len(self._pending) < self.max_items:
+                return
+            batch = self._take()
+        self._process(batch)
+
+    def close(self):
+        """Processes the messages still waiting and nacks any that arrive afterwards."""
+        with self._condition:
+            self._closed = True
+            batch = self._take()
+            self._condition.notify()
+        self._flusher.join()
+        if batch:
+            self._process(batch)
+
+    def _take(self):
+        batch, self._pending = self._pending, []
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._pending or time.monotonic() < self._deadline):
+                    self._condition.wait(self._deadline - time.monotonic() if self._pending else None)
+                if self._closed:
+                    return
+                batch = self._take()
+            self._process(batch)
+
+    def _process(self, batch):
+        try:
+            results = self.batch_handler(batch)
+        except Exception as e:
+            logger.error(f"Batch handler failed for {len(batch)} messages: {type(e).__name__} – {e}")
+            results = [False] * len(batch)
+        results = [True] * len(batch) if results is None else list(results)
+        if len(results) != len(batch):
+            logger.error(f"Batch handler returned {len(results)} results for {len(batch)} messages, nacking the messages without one")
+            results = results[:len(batch)] + [False] * (len(batch) - len(results))
+        acked = nacked = 0
+        for message, result in zip(batch, results):
+            if result:
+                message.ack()
+                acked += 1
+            else:
+                message.nack()
+                nacked += 1
+        with self._condition:
+            self.batches += 1
+            self.acked += acked
+            self.nacked += nacked
+
+    def stats(self):
+        return {"batches": self.batches, "acked": self.acked, "nacked": self.nacked, "pending": len(self._pending)}
@@ -1,27 +1,82 @@
-import json
 from google.cloud import pubsub_v1
-from concurrent.futures import ThreadPoolExecutor
 from google.api_core.exceptions import NotFound, AlreadyExists
 
 from app_instance import app, logger  # Updated import to include logger from app_instance
+from app.utils.custom_logger import set_log_context
+from app.pubsub.adaptive_worker_tuner import AdaptiveWorkerTuner
+from app.pubsub.asyncio_scheduler import AsyncioScheduler
+from app.pubsub.batching_consumer import BatchingConsumer
+from app.pubsub.message_decoder import MessageDecodeError, tracked_message_decoder
+from app.pubsub.message_dedup import MessageDeduplicator, build_dedup_store
+from app.utils.custom_thread_pool_executor import PropagatingThreadPoolExecutor
+
+# Set by start_subscriber(), used by stop_subscriber()
+streaming_pull_future = None
+executor = None
+scheduler = None
+worker_tuner = None
+subscriber_callback = None
+deduplicator = None
 
 
 def consume_message(message):
     logger.info("Message received: %s", message.data)
     try:
-        data = json.loads(message.data.decode('utf-8'))
-        user_id = data["user_id"]
-        request_id = data["request_id"]
-        session_id = data["session_id"]
-        query_id = data["query_id"]
+        tracked_message = tracked_message_decoder.decode(message)
+        # Each message runs in its own copy of the context (see PropagatingThreadPoolExecutor), so this doesn't leak into the next one
+        set_log_context(request_id=tracked_message.request_id, session_id=tracked_message.session_id,
+                        user_id=tracked_message.user_id, query_id=tracked_message.query_id)
         logger.info("Message deserialized successfully")
         logger.info("Message processing finished successfully")
+    except MessageDecodeError as e:
+        # A redelivery wouldn't fix a malformed message, it is acked as well
+        logger.error(f"Invalid message {message.message_id}: {e}")
     except Exception as e:
         logger.error(f"Error processing message: {type(e).__name__} – {e}")
     logger.info("Doing ACK to pub/sub")
     message.ack()
 
 
+async def consume_message_async(message):
+    """Coroutine counterpart of consume_message, used in the asyncio consumer mode. Await the message's I/O here."""
+    logger.info("Message received: %s", message.data)
+    try:
+        tracked_message = tracked_message_decoder.decode(message)
+        # Each message runs in its own asyncio task, so this doesn't leak into the next one
+        set_log_context(request_id=tracked_message.request_id, session_id=tracked_message.session_id,
+                        user_id=tracked_message.user_id, query_id=tracked_message.query_id)
+        logger.info("Message deserialized successfully")
+        logger.info("Message processing finished successfully")
+    except MessageDecodeError as e:
+        # A redelivery wouldn't fix a malformed message, it is acked as well
+        logger.error(f"Invalid message {message.message_id}: {e}")
+    except Exception as e:
+        logger.error(f"Error processing message: {type(e).__name__} – {e}")
+    logger.info("Doing ACK to pub/sub")
+    message.ack()
+
+
+def consume_messages(messages):
+    """Batch counterpart of consume_message, used as the handler of a BatchingConsumer.
+
+    Returns one result per message, True to ack it. Bulk writes (Mongo insert_many, Redis pipelines)
+    for the whole batch belong here.
+    """
+    logger.info(f"Batch of {len(messages)} messages received")
+    results = []
+    tracked_messages = []
+    for message in messages:
+        try:
+            tracked_messages.append(tracked_message_decoder.decode(message))
+        except MessageDecodeError as e:
+            logger.error(f"Invalid message {message.message_id}: {e}")
+        # Like consume_message, messages that can't be decoded are acked as well, a redelivery wouldn't fix them
+        results.append(True)
+    # The bulk writes of the batch go here, over tracked_messages
+    logger.info(f"Batch of {len(messages)} messages processed, {len(tracked_messages)} valid, doing ACK to pub/sub")
+    return results
+
+
 def create_topic_if_not_exists(publisher, topic_path):
     try:
         publisher.get_topic(topic=topic_path)
@@ -40,7 +95,52 @@ def create_subscription_if_not_exists(subscriber, topic_path, subscription_path)
         logger.info(f"Created subscription: {subscription_path}")
 
 
-def start_subscriber(callback, max_workers=1):
+def build_flow_control():
+    """FlowControl from the pubsub.consumer settings, the client library's defaults apply to the ones not set."""
+    settings = {
+        'max_messages': getattr(app.state, 'PUBSUB_CONSUMER_MAX_MESSAGES', None),
+        'max_bytes': getattr(app.state, 'PUBSUB_CONSUMER_MAX_BYTES', None),
+        'max_lease_duration': getattr(app.state, 'PUBSUB_CONSUMER_MAX_LEASE_DURATION', None),
+        'min_duration_per_lease_extension': getattr(app.state, 'PUBSUB_CONSUMER_MIN_DURATION_PER_LEASE_EXTENSION', None),
+        'max_duration_per_lease_extension': getattr(app.state, 'PUBSUB_CONSUMER_MAX_DURATION_PER_LEASE_EXTENSION', None),
+    }
+    return pubsub_v1.types.FlowControl(**{key: value for key, value in settings.items() if value is not None})
+
+
+def build_callback():
+    """consume_message (consume_message_async in the asyncio consumer mode), or a BatchingConsumer around
+    consume_messages when pubsub.consumer.batch_max_items is set.
+
+    With pubsub.consumer.dedup, single message callbacks skip messages that were already processed.
+    """
+    global deduplicator
+    batch_max_items = getattr(app.state, 'PUBSUB_CONSUMER_BATCH_MAX_ITEMS', 0)
+    if not batch_max_items:
+        callback = consume_message_async if getattr(app.state, 'PUBSUB_CONSUMER_MODE', 'thread') == 'asyncio' else consume_message
+        if getattr(app.state, 'PUBSUB_CONSUMER_DEDUP', False):
+            deduplicator = MessageDeduplicator(build_dedup_store(), key=getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_KEY', 'message_id'),
+                                               retry_delay=getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_RETRY_DELAY', 60))
+            logger.info(f"Deduplicating messages by {deduplicator.key} with {deduplicator.store.stats()['backend']} store")
+            callback = deduplicator.wrap(callback)
+        return callback
+    batch_max_latency_ms = getattr(app.state, 'PUBSUB_CONSUMER_BATCH_MAX_LATENCY_MS', 50)
+    logger.info(f"Consuming messages in batches of up to {batch_max_items} items or {batch_max_latency_ms}ms")
+    return BatchingConsumer(consume_messages, max_items=batch_max_items, max_latency_ms=batch_max_latency_ms)
+
+
+def start_subscriber(callback, max_workers=None, mode=None, loop=None):
+    """Subscribes 'callback' to the configured subscription and blocks until the subscriber stops.
+
+    In the 'thread' mode (pubsub.consumer.mode) callbacks run on a pool of max_workers threads. In the
+    'asyncio' mode each message is dispatched as a task on 'loop', or on a loop of the subscriber's own
+    when None, up to pubsub.consumer.max_concurrency at once; sync callbacks still run on the pool.
+    """
+    global streaming_pull_future, executor, scheduler, worker_tuner, subscriber_callback
+    subscriber_callback = callback
+    if max_workers is None:
+        max_workers = getattr(app.state, 'PUBSUB_CONSUMER_MAX_WORKERS', 2)
+    if mode is None:
+        mode = getattr(app.state, 'PUBSUB_CONSUMER_MODE', 'thread')
     project_id = app.state.APP_PROJECT_ID
     topic_id = app.state.PUBSUB_TOPIC_ID
     subscription_id = app.state.PUBSUB_SUBSCRIPTION_ID
@@ -55,8 +155,34 @@ def start_subscriber(callback, max_workers=1):
     create_topic_if_not_exists(publisher, topic_path)
     create_subscription_if_not_exists(subscriber, topic_path, subscription_path)
 
-    logger.info("Creating ThreadPoolExecutor with max_workers=%d", max_workers)
-    executor = ThreadPoolExecutor(max_workers=max_workers)
+    if mode == 'asyncio':
+        # Submitted from the event loop, which must never block: the scheduler's concurrency limit bounds the queue instead
+        max_queue_size = None
+    else:
+        max_queue_size = getattr(app.state, 'PUBSUB_EXECUTOR_MAX_QUEUE_SIZE', 100)
+    logger.info(f"Creating ThreadPoolExecutor with max_workers={max_workers}, max_queue_size={max_queue_size}")
+    # When the queue is full the scheduler blocks, so the subscriber stops dispatching messages until the workers catch up
+    executor = PropagatingThreadPoolExecutor(max_workers=max_workers, name='pubsub-subscriber', max_queue_size=max_queue_size, overflow_policy='block')
+    if mode == 'asyncio':
+        max_concurrency = getattr(app.state, 'PUBSUB_CONSUMER_MAX_CONCURRENCY', 1000)
+        logger.info(f"Dispatching messages as asyncio tasks, up to {max_concurrency} at once, on a {'shared' if loop else 'dedicated'} event loop")
+        scheduler = AsyncioScheduler(loop=loop, max_concurrency=max_concurrency, executor=executor)
+    else:
+        scheduler = pubsub_v1.subscriber.scheduler.ThreadScheduler(executor=executor)
+
+    max_workers_limit = getattr(app.state, 'PUBSUB_CONSUMER_MAX_WORKERS_LIMIT', max_workers)
+    if max_workers_limit > max_workers:
+        worker_tuner = AdaptiveWorkerTuner(
+            executor,
+            max_workers_limit=max_workers_limit,
+            target_latency=getattr(app.state, 'PUBSUB_CONSUMER_TARGET_LATENCY_MS', 1000) / 1000,
+            interval=getattr(app.state, 'PUBSUB_CONSUMER_TUNING_INTERVAL', 10),
+        )
+        worker_tuner.start()
+
+    flow_control = build_flow_control()
+    logger.info(f"Flow control: max_messages={flow_control.max_messages}, max_bytes={flow_control.max_bytes}, "
+                f"max_lease_duration={flow_control.max_lease_duration}, workers {max_workers} up to {max_workers_limit}")
 
     logger.info("Creating Pub/Sub subscriber client")
 
@@ -65,7 +191,8 @@ def start_subscriber(callback, max_workers=1):
         streaming_pull_future = subscriber.subscribe(
             subscription_path,
             callback=callback,
-            scheduler=pubsub_v1.subscriber.scheduler.ThreadScheduler(executor=executor)
+            scheduler=scheduler,
+            flow_control=flow_control,
         )
 
         logger.info(f"Listening for messages on {subscription_path}..\n")
@@ -83,4 +210,28 @@ def start_subscriber(callback, max_workers=1):
         logger.error("Failed to start subscriber: %s", e)
 
 
-
+def stop_subscriber(timeout=30):
+    """Stops pulling messages and waits up to 'timeout' seconds for the callbacks already running.
+
+    Messages that were pulled but not dispatched yet are nacked by the subscriber and redelivered.
+    """
+    if worker_tuner is not None:
+        worker_tuner.stop()
+    if isinstance(subscriber_callback, BatchingConsumer):
+        # Acks only reach Pub/Sub while the stream is open, so the waiting batch goes before cancelling it
+        subscriber_callback.close()
+    if streaming_pull_future is not None:
+        streaming_pull_future.cancel()
+        # Once the stream is shut down, nothing more is dispatched to the callbacks being drained
+        try:
+            streaming_pull_future.result(timeout)
+        except Exception as e:
+            logger.warning(f"Pub/Sub streaming pull didn't shut down cleanly: {type(e).__name__} – {e}")
+    if isinstance(scheduler, AsyncioScheduler):
+        drained = scheduler.drain(timeout)
+        logger.info(f"Pub/Sub asyncio scheduler drained: {drained}, stats: {scheduler.stats()}")
+    if executor is not None:
+        drained = executor.drain(timeout)
+        logger.info(f"Pub/Sub subscriber executor drained: {drained}, metrics: {executor.metrics()}")
+    if deduplicator is not None:
+        logger.info(f"Pub/Sub message dedup stats: {deduplicator.stats()}")
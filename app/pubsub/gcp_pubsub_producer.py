@@ -1,18 +1,110 @@
 # controller_pubsub_producer.py
 
-import json
+import asyncio
+import threading
 
-from app_instance import logger, app
+from app_instance import logger, app, shutdown_hooks
+from app.utils import json_codec
 from fastapi.responses import JSONResponse
 from google.cloud import pubsub_v1
 
 
+class Publisher:
+    """Publishes to one topic without blocking the event loop.
+
+    The PublisherClient is created on first use, with the batching and flow control settings of the
+    pubsub.publisher config. publish() returns as soon as the message is queued in a batch and the
+    returned coroutine completes when Pub/Sub acknowledges it, so concurrent publishes share batches.
+    """
+
+    def __init__(self, project_id, topic_id):
+        self.project_id = project_id
+        self.topic_id = topic_id
+        self._client = None
+        self._lock = threading.Lock()
+        self.limit_exceeded_behavior = getattr(app.state, 'PUBSUB_PUBLISHER_FLOW_CONTROL_LIMIT_EXCEEDED_BEHAVIOR', 'ignore')
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def topic_path(self):
+        return pubsub_v1.PublisherClient.topic_path(self.project_id, self.topic_id)
+
+    def _create_client(self):
+        batch_settings = pubsub_v1.types.BatchSettings(
+            max_messages=getattr(app.state, 'PUBSUB_PUBLISHER_BATCH_MAX_MESSAGES', 100),
+            max_bytes=getattr(app.state, 'PUBSUB_PUBLISHER_BATCH_MAX_BYTES', 1000000),
+            max_latency=getattr(app.state, 'PUBSUB_PUBLISHER_BATCH_MAX_LATENCY', 0.01),
+        )
+        flow_control = pubsub_v1.types.PublishFlowControl(
+            message_limit=getattr(app.state, 'PUBSUB_PUBLISHER_FLOW_CONTROL_MESSAGE_LIMIT', 1000),
+            byte_limit=getattr(app.state, 'PUBSUB_PUBLISHER_FLOW_CONTROL_BYTE_LIMIT', 10000000),
+            limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior(self.limit_exceeded_behavior),
+        )
+        publisher_options = pubsub_v1.types.PublisherOptions(
+            enable_message_ordering=getattr(app.state, 'PUBSUB_PUBLISHER_ENABLE_MESSAGE_ORDERING', False),
+            flow_control=flow_control,
+        )
+        logger.info(f"Creating Pub/Sub publisher for {self.topic_path}: {batch_settings}, {flow_control}")
+        return pubsub_v1.PublisherClient(batch_settings=batch_settings, publisher_options=publisher_options)
+
+    async def publish(self, data, ordering_key='', **attributes):
+        """Publishes 'data' (bytes, or any value json_codec can serialize) and returns its message id.
+
+        Messages with the same non-empty 'ordering_key' are delivered in publish order, this needs
+        pubsub.publisher.enable_message_ordering. After a failed publish the key is resumed, so later
+        messages with it aren't rejected.
+        """
+        future = await self._publish(data, ordering_key, attributes)
+        try:
+            return await asyncio.wrap_future(future)
+        except Exception:
+            if ordering_key:
+                self.client.resume_publish(self.topic_path, ordering_key)
+            raise
+
+    async def publish_many(self, messages, ordering_key='', return_exceptions=False):
+        """Publishes all 'messages' and returns their message ids, in order.
+
+        The messages are queued before any acknowledgement is awaited, so they go out in as few batches
+        as the batch settings allow. With return_exceptions, failed messages get their exception in
+        place of a message id instead of raising the first failure.
+        """
+        futures = [await self._publish(data, ordering_key, {}) for data in messages]
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        if failed and ordering_key:
+            self.client.resume_publish(self.topic_path, ordering_key)
+        if failed and not return_exceptions:
+            raise failed[0]
+        return results
+
+    async def _publish(self, data, ordering_key, attributes):
+        if not isinstance(data, bytes):
+            data = json_codec.dumps(data)
+        if self.limit_exceeded_behavior == 'block':
+            # With the 'block' flow control behavior publish() waits for room in the client, off the event loop
+            return await asyncio.to_thread(self.client.publish, self.topic_path, data, ordering_key=ordering_key, **attributes)
+        return self.client.publish(self.topic_path, data, ordering_key=ordering_key, **attributes)
+
+    def stop(self):
+        """Sends the messages still waiting in batches and stops the client."""
+        if self._client is not None:
+            self._client.stop()
+
 
 project_id = app.state.PUBSUB_PROJECT_ID
 topic_id = app.state.PUBSUB_TOPIC_ID
 subscription_id = app.state.PUBSUB_SUBSCRIPTION_ID
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(project_id, topic_id)
+publisher = Publisher(project_id, topic_id)
+topic_path = publisher.topic_path
+shutdown_hooks.append(publisher.stop)
 
 
 class Message:
@@ -24,20 +116,11 @@ class Message:
 async def template(message: Message):
     try:
 
-        # Convert the entire request JSON to a string
-        message = json.dumps(message).encode('utf-8')
-
-        future = publisher.publish(topic_path, message)
-        message_id = future.result()
+        # The request JSON is serialized by the publisher
+        message_id = await publisher.publish(message)
 
         logger.info("Message published for template processing Pub/Sub Queue")
         return JSONResponse(content={'message_id': message_id}, status_code=200)
 
     except Exception as e:
         logger.exception(f"Error sending message into Pub/Sub queue: {str(e)}")
-
-
-
-
-
-
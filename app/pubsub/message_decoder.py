@@ -0,0 +1,86 @@
+# message_decoder.py
+
+import dataclasses
+import typing
+
+from app.model.tracked_message import TrackedMessage
+from app.proto.gen import BaseModel1_pb2
+from app.utils import json_codec
+
+_MISSING = object()
+
+
+class MessageDecodeError(ValueError):
+    """Raised when a Pub/Sub payload can't be decoded into its schema."""
+
+
+def is_protobuf(attributes):
+    # 'encoding' is set by our publishers, 'googclient_schemaencoding' by Pub/Sub for topics with a protobuf schema
+    return attributes.get('encoding') == 'protobuf' or attributes.get('googclient_schemaencoding') == 'BINARY'
+
+
+class MessageDecoder:
+    """Decodes Pub/Sub payloads into instances of a dataclass 'schema' and validates them.
+
+    The schema's fields, types and required flags are read once, so decoding a message is a parse
+    with json_codec (orjson when installed, straight from the payload bytes) and one pass over the
+    fields. Payloads of messages with a protobuf encoding attribute are parsed with 'proto_class',
+    whose fields are matched to the schema by name.
+
+    Protobuf can't tell a scalar field set to its default value ("", 0, False) from an unset one,
+    so those fields are always present in a protobuf payload, with their default value when unset:
+    an empty string is a valid value in either encoding.
+    """
+
+    def __init__(self, schema, proto_class=None):
+        self.schema = schema
+        self.proto_class = proto_class
+        types = typing.get_type_hints(schema)
+        self._fields = tuple(
+            (field.name, types[field.name] if isinstance(types[field.name], type) else None,
+             field.default is dataclasses.MISSING and field.default_factory is dataclasses.MISSING)
+            for field in dataclasses.fields(schema)
+        )
+        if proto_class is not None:
+            names = {field.name for field in dataclasses.fields(schema)}
+            # (name, whether the field tracks presence: message and 'optional' fields do, plain scalars don't)
+            self._proto_fields = tuple((field.name, field.has_presence) for field in proto_class.DESCRIPTOR.fields if field.name in names)
+
+    def decode(self, message):
+        """Decodes a Pub/Sub message, raises MessageDecodeError when the payload doesn't match the schema."""
+        if self.proto_class is not None and message.attributes and is_protobuf(message.attributes):
+            return self.from_protobuf(message.data)
+        return self.from_json(message.data)
+
+    def from_json(self, data):
+        try:
+            values = json_codec.loads(data)
+        except Exception as e:
+            raise MessageDecodeError(f"Invalid JSON payload: {e}") from e
+        if not isinstance(values, dict):
+            raise MessageDecodeError(f"Expected a JSON object, got {type(values).__name__}")
+        return self.from_dict(values)
+
+    def from_protobuf(self, data):
+        try:
+            proto_message = self.proto_class.FromString(data)
+        except Exception as e:
+            raise MessageDecodeError(f"Invalid {self.proto_class.__name__} payload: {e}") from e
+        return self.from_dict({name: getattr(proto_message, name) for name, has_presence in self._proto_fields
+                               if not has_presence or proto_message.HasField(name)})
+
+    def from_dict(self, values):
+        kwargs = {}
+        for name, field_type, required in self._fields:
+            value = values.get(name, _MISSING)
+            if value is _MISSING:
+                if required:
+                    raise MessageDecodeError(f"Missing field '{name}'")
+                continue
+            if field_type is not None and not isinstance(value, field_type):
+                raise MessageDecodeError(f"Field '{name}' must be {field_type.__name__}, got {type(value).__name__}")
+            kwargs[name] = value
+        return self.schema(**kwargs)
+
+
+tracked_message_decoder = MessageDecoder(TrackedMessage, BaseModel1_pb2.TrackedMessage)
@@ -0,0 +1,234 @@
+# message_dedup.py
+
+import asyncio
+import concurrent.futures
+import threading
+
+from app_instance import app, logger
+from app.pubsub.asyncio_scheduler import is_coroutine_callback
+from app.utils import json_codec
+from app.utils.lru_cache import LRUCache
+
+try:
+    import redis
+except ImportError:  # redis is optional, only the in-memory store is available without it
+    redis = None
+
+# Results of DedupStore.claim()
+CLAIMED = 'claimed'
+DONE = 'done'
+IN_PROGRESS = 'in_progress'
+
+
+class InMemoryDedupStore:
+    """Dedup store of this process: the keys of completed messages are kept for 'ttl' seconds, up to 'max_entries'."""
+
+    # Whether the store does network I/O, which async callbacks keep off the event loop
+    blocking = False
+
+    def __init__(self, max_entries=100000, ttl=3600):
+        self._done = LRUCache(max_entries=max_entries, ttl=ttl)
+        self._in_progress = set()
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """Returns CLAIMED when the caller should process the message, DONE or IN_PROGRESS when it shouldn't."""
+        with self._lock:
+            if self._done.get(key) is not None:
+                return DONE
+            if key in self._in_progress:
+                return IN_PROGRESS
+            self._in_progress.add(key)
+            return CLAIMED
+
+    def complete(self, key):
+        with self._lock:
+            self._in_progress.discard(key)
+            self._done.set(key, True)
+
+    def release(self, key):
+        with self._lock:
+            self._in_progress.discard(key)
+
+    def stats(self):
+        return {"backend": "memory", "size": len(self._done), "in_progress": len(self._in_progress)}
+
+
+class RedisDedupStore:
+    """Dedup store shared by every instance of the service.
+
+    A claim is a SET NX that expires after 'claim_ttl' seconds, so the claim of an instance that died
+    mid-message lets a redelivery through. Completed keys are kept for 'ttl' seconds.
+    """
+
+    blocking = True
+
+    def __init__(self, client, ttl=3600, claim_ttl=600, prefix='pubsub:dedup:'):
+        self.client = client
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self.prefix = prefix
+
+    # SET NX attempts when the key keeps expiring or being released right after a failed one
+    max_claim_attempts = 3
+
+    def claim(self, key):
+        for _ in range(self.max_claim_attempts):
+            if self.client.set(self.prefix + key, IN_PROGRESS, nx=True, ex=self.claim_ttl):
+                return CLAIMED
+            state = self.client.get(self.prefix + key)
+            if state is not None:
+                return DONE if state in (DONE, DONE.encode()) else IN_PROGRESS
+            # Expired or released between the two calls
+        # Still held by someone a moment ago, it comes back later
+        return IN_PROGRESS
+
+    def complete(self, key):
+        self.client.set(self.prefix + key, DONE, ex=self.ttl)
+
+    def release(self, key):
+        self.client.delete(self.prefix + key)
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+class MessageDeduplicator:
+    """Skips Pub/Sub messages that were already processed, and processes concurrent duplicates once.
+
+    Messages are identified by their message_id or, with key='request_id', by the request_id of their
+    JSON payload (falling back to the message_id), which also catches a message published twice.
+    Duplicates that arrive while this process is handling the message wait for the outcome: they are
+    acked if it succeeded and nacked if it failed. Duplicates handled by another instance get an ack
+    deadline of 'retry_delay' seconds and are released, so they come back once that instance is likely
+    done instead of being redelivered right away, again and again, for as long as it holds the claim.
+    """
+
+    def __init__(self, store, key='message_id', retry_delay=60):
+        self.store = store
+        self.key = key
+        self.retry_delay = retry_delay
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def message_key(self, message):
+        if self.key == 'request_id':
+            try:
+                request_id = json_codec.loads(message.data).get('request_id')
+            except Exception:
+                request_id = None
+            if request_id:
+                return f"request_id:{request_id}"
+        return f"message_id:{message.message_id}"
+
+    def _begin(self, key):
+        """Returns (state, future): the in-process leader's future to wait for, or this message's own when CLAIMED."""
+        with self._lock:
+            leader = self._in_flight.get(key)
+            if leader is not None:
+                self.coalesced += 1
+                return IN_PROGRESS, leader
+            future = concurrent.futures.Future()
+            self._in_flight[key] = future
+        try:
+            state = self.store.claim(key)
+        except Exception as e:
+            # Better to process a message twice than to stop processing when the store is down
+            logger.error(f"Dedup store claim failed for {key}: {type(e).__name__} – {e}")
+            state = CLAIMED
+        with self._lock:
+            if state == CLAIMED:
+                self.misses += 1
+            else:
+                self.hits += 1
+                del self._in_flight[key]
+        if state != CLAIMED:
+            future.set_result(state == DONE)
+            return state, None
+        return CLAIMED, future
+
+    def _finish(self, key, future, succeeded):
+        try:
+            if succeeded:
+                self.store.complete(key)
+            else:
+                self.store.release(key)
+        except Exception as e:
+            logger.error(f"Dedup store update failed for {key}: {type(e).__name__} – {e}")
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_result(succeeded)
+
+    def _skip(self, message, key, state, future):
+        """Acks or defers a duplicate, 'future' being the in-process leader's outcome, None when the store answered."""
+        if future is None and state == IN_PROGRESS:
+            logger.info(f"Deferring duplicate message {message.message_id} ({key}) by {self.retry_delay}s, being processed elsewhere")
+            # Redelivered once the deadline lapses, out of this subscriber's lease management meanwhile
+            message.modify_ack_deadline(self.retry_delay)
+            message.drop()
+        elif state == DONE or future.result():
+            logger.info(f"Skipping duplicate message {message.message_id} ({key}), already processed")
+            message.ack()
+        else:
+            logger.info(f"Nacking duplicate message {message.message_id} ({key}), processing failed")
+            message.nack()
+
+    def wrap(self, callback):
+        """Returns a subscriber callback that runs 'callback' once per message key. Raising marks the message as not processed."""
+        if is_coroutine_callback(callback):
+            async def deduplicated_callback(message):
+                key = self.message_key(message)
+                state, future = await asyncio.to_thread(self._begin, key) if self.store.blocking else self._begin(key)
+                if state != CLAIMED:
+                    if future is not None:
+                        await asyncio.wrap_future(future)
+                    self._skip(message, key, state, future)
+                    return
+                succeeded = False
+                try:
+                    await callback(message)
+                    succeeded = True
+                finally:
+                    if self.store.blocking:
+                        await asyncio.to_thread(self._finish, key, future, succeeded)
+                    else:
+                        self._finish(key, future, succeeded)
+        else:
+            def deduplicated_callback(message):
+                key = self.message_key(message)
+                state, future = self._begin(key)
+                if state != CLAIMED:
+                    self._skip(message, key, state, future)
+                    return
+                succeeded = False
+                try:
+                    callback(message)
+                    succeeded = True
+                finally:
+                    self._finish(key, future, succeeded)
+        return deduplicated_callback
+
+    def stats(self):
+        with self._lock:
+            stats = {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+        stats.update(self.store.stats())
+        return stats
+
+
+def build_dedup_store():
+    """The store selected by pubsub.consumer.dedup_backend: 'memory' or 'redis' (using the database.redis settings)."""
+    ttl = getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_TTL', 3600)
+    if getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_BACKEND', 'memory') == 'redis':
+        if redis is None:
+            raise RuntimeError("pubsub.consumer.dedup_backend is 'redis' but the redis package isn't installed")
+        client = redis.Redis(
+            host=app.state.DATABASE_REDIS_HOST,
+            port=app.state.DATABASE_REDIS_PORT,
+            password=app.state.DATABASE_REDIS_PASSWORD,
+        )
+        return RedisDedupStore(client, ttl=ttl, claim_ttl=getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_CLAIM_TTL', 600))
+    return InMemoryDedupStore(max_entries=getattr(app.state, 'PUBSUB_CONSUMER_DEDUP_MAX_ENTRIES', 100000), ttl=ttl)
@@ -1,10 +1,11 @@
-import json
+import hashlib
 import os
-from urllib.request import urlopen
 from functools import wraps
 from fastapi import Request, HTTPException, Depends
 from jose import jwt
 from app_instance import app, logger
+from app.service.jwks_key_store import JwksKeyStore
+from app.utils.lru_cache import LRUCache
 
 
 AUTH0_DOMAIN = app.state.AUTH_DOMAIN
@@ -13,6 +14,17 @@ ALGORITHMS = app.state.AUTH_ALGORITHMS
 defaultEnvironment = app.state.DEFAULT_ENVIRONMENT
 defaultEnvironment = 'development'
 
+# Signing keys are cached per 'kid' instead of being downloaded on every request
+jwks_store = JwksKeyStore(
+    f"https://{AUTH0_DOMAIN}/.well-known/jwks.json",
+    ttl=getattr(app.state, 'AUTH_JWKS_CACHE_TTL', 600),
+    min_refetch_interval=getattr(app.state, 'AUTH_JWKS_MIN_REFETCH_INTERVAL', 30),
+    fetch_timeout=getattr(app.state, 'AUTH_JWKS_FETCH_TIMEOUT', 5),
+)
+
+# Payloads of verified tokens, keyed by the SHA-256 of the token and expiring at its 'exp' claim
+token_cache = LRUCache(max_entries=getattr(app.state, 'AUTH_TOKEN_CACHE_SIZE', 10000))
+
 
 # Error handler
 class AuthError(Exception):
@@ -39,6 +51,30 @@ def get_token_auth_header(request: Request):
     return parts[1]
 
 
+async def verify_token(token):
+    """Verifies the token signature and claims against the IdP signing keys and returns its payload"""
+    unverified_header = jwt.get_unverified_header(token)
+    rsa_key = await jwks_store.get_key(unverified_header["kid"])
+    if not rsa_key:
+        raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
+
+    try:
+        return jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer=f"https://{AUTH0_DOMAIN}/"
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({"code": "token_expired", "description": "token is expired"}, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({"code": "invalid_claims", "description": "incorrect claims, please check the audience and issuer"}, 401)
+    except Exception as e:
+        logger.error(f"Token parsing error: {e}")
+        raise AuthError({"code": "invalid_header", "description": "Unable to parse authentication token."}, 401)
+
+
 # This checks if the JWT in Auth header is valid, decodes it and assigns the payload to g.current_user. If not it raises an authentication error
 def requires_auth(f):
     """Determines if the Access Token is valid"""
@@ -51,40 +87,16 @@ def requires_auth(f):
 
         try:
             token = get_token_auth_header(request)
-            jsonurl = urlopen(f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
-            jwks = json.loads(jsonurl.read())
-            unverified_header = jwt.get_unverified_header(token)
-            rsa_key = {}
-            for key in jwks["keys"]:
-                if key["kid"] == unverified_header["kid"]:
-                    rsa_key = {
-                        "kty": key["kty"],
-                        "kid": key["kid"],
-                        "use": key["use"],
-                        "n": key["n"],
-                        "e": key["e"]
-                    }
-            if rsa_key:
-                try:
-                    payload = jwt.decode(
-                        token,
-                        rsa_key,
-                        algorithms=ALGORITHMS,
-                        audience=API_AUDIENCE,
-                        issuer=f"https://{AUTH0_DOMAIN}/"
-                    )
-                except jwt.ExpiredSignatureError:
-                    raise AuthError({"code": "token_expired", "description": "token is expired"}, 401)
-                except jwt.JWTClaimsError:
-                    raise AuthError({"code": "invalid_claims", "description": "incorrect claims, please check the audience and issuer"}, 401)
-                except Exception as e:
-                    logger.error(f"Token parsing error: {e}")
-                    raise AuthError({"code": "invalid_header", "description": "Unable to parse authentication token."}, 401)
-
-                request.state.current_user = payload
-                return await f(request, *args, **kwargs)
-            else:
-                raise AuthError({"code": "invalid_header", "description": "Unable to find appropriate key"}, 401)
+            # Tokens that were already verified skip the RSA signature check until they expire
+            token_digest = hashlib.sha256(token.encode()).digest()
+            payload = token_cache.get(token_digest)
+            if payload is None:
+                payload = await verify_token(token)
+                if "exp" in payload:
+                    token_cache.set(token_digest, payload, expires_at=payload["exp"])
+
+            request.state.current_user = dict(payload)  # Handlers must not mutate the cached payload
+            return await f(request, *args, **kwargs)
 
         except AuthError as e:
             logger.error(f"Authentication error: {e}")
@@ -0,0 +1,107 @@
+# bulk_ingest.py
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+import threading
+
+from app_instance import logger, shutdown_hooks
+from app.utils import json_codec
+
+
+class BulkIngestor:
+    """Ingests batches of objects carrying a JSON document in 'field' (ObjectExample.jsonData).
+
+    handler(objects, data) is called once per chunk of up to 'chunk_size' objects, with the decoded
+    document of each object (None when it's empty or not valid JSON), so the handler can work on
+    the whole chunk at once. The documents of a chunk are decoded in one call with the fast JSON
+    backend. Batches of at least 'process_pool_min_items' objects have their chunks decoded in
+    parallel by a pool of 'max_processes' processes, 0 always decodes in this process.
+    """
+
+    def __init__(self, handler, chunk_size=1000, process_pool_min_items=0, max_processes=None, field='jsonData'):
+        self.handler = handler
+        self.chunk_size = chunk_size
+        self.process_pool_min_items = process_pool_min_items
+        self.max_processes = max_processes
+        self.field = field
+        self.received = 0
+        self.invalid = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        shutdown_hooks.append(self.close)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    # Spawned rather than forked: forking a process running gRPC and Pub/Sub threads isn't safe
+                    self._pool = concurrent.futures.ProcessPoolExecutor(self.max_processes, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def ingest(self, objects):
+        """Ingests a batch of objects, returns how many had an invalid document."""
+        field = self.field
+        chunks = [objects[start:start + self.chunk_size] for start in range(0, len(objects), self.chunk_size)]
+        documents = ([getattr(item, field) for item in chunk] for chunk in chunks)
+        if self.process_pool_min_items and len(objects) >= self.process_pool_min_items:
+            decoded = self.pool.map(json_codec.loads_many, documents)
+        else:
+            decoded = map(json_codec.loads_many, documents)
+        invalid = 0
+        for chunk, (data, invalid_indexes) in zip(chunks, decoded):
+            invalid += len(invalid_indexes)
+            self.handler(chunk, data)
+        with self._lock:
+            self.received += len(objects)
+            self.invalid += invalid
+        return invalid
+
+    def ingest_stream(self, batches):
+        """Ingests the objects of an iterable of batches, like the messages of a client stream.
+
+        Objects are regrouped into chunks of chunk_size whatever the size of the batches. Returns
+        (objects received, objects with an invalid document).
+        """
+        received = invalid = 0
+        buffer = []
+        for batch in batches:
+            buffer.extend(batch)
+            if len(buffer) >= self.chunk_size:
+                buffer, ready = self._split(buffer)
+                received += len(ready)
+                invalid += self.ingest(ready)
+        if buffer:
+            received += len(buffer)
+            invalid += self.ingest(buffer)
+        return received, invalid
+
+    async def ingest_stream_async(self, batches):
+        """ingest_stream() for an async iterable of batches. Chunks are decoded and handled off the event loop."""
+        received = invalid = 0
+        buffer = []
+        async for batch in batches:
+            buffer.extend(batch)
+            if len(buffer) >= self.chunk_size:
+                buffer, ready = self._split(buffer)
+                received += len(ready)
+                invalid += await asyncio.to_thread(self.ingest, ready)
+        if buffer:
+            received += len(buffer)
+            invalid += await asyncio.to_thread(self.ingest, buffer)
+        return received, invalid
+
+    def _split(self, buffer):
+        """Returns (the remainder, the objects filling whole chunks)."""
+        whole = len(buffer) - len(buffer) % self.chunk_size
+        return buffer[whole:], buffer[:whole]
+
+    def stats(self):
+        with self._lock:
+            return {"received": self.received, "invalid": self.invalid}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            logger.info(f"Bulk ingest process pool stopped, {self.stats()}")
@@ -0,0 +1,85 @@
+# jwks_key_store.py
+
+import asyncio
+import time
+
+from app_instance import logger
+from app.client.http_client import http_client
+
+
+class JwksKeyStore:
+    """Caches the signing keys published by the IdP, keyed by 'kid'.
+
+    Keys are served from memory and refreshed in the background once they are older than 'ttl'.
+    A token signed with an unknown 'kid' triggers a refetch (the IdP may have rotated its keys),
+    but never more often than 'min_refetch_interval'. Only one fetch is in flight at any time,
+    and if the IdP is unreachable the keys from the last successful fetch keep being served.
+    """
+
+    def __init__(self, jwks_url, ttl=600, min_refetch_interval=30, fetch_timeout=5):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refetch_interval = min_refetch_interval
+        self.fetch_timeout = fetch_timeout
+        self._keys = {}
+        self._fetched_at = float('-inf')  # Last successful fetch
+        self._last_attempt = float('-inf')  # Last fetch attempt, successful or not
+        self._refresh_task = None
+
+    async def get_key(self, kid):
+        """Returns the RSA key for the given 'kid', or None if the IdP does not publish it."""
+        now = time.monotonic()
+        key = self._keys.get(kid)
+        if key is not None:
+            if now - self._fetched_at > self.ttl and self._can_fetch(now):
+                self._schedule_refresh()  # Keep serving the current key while refreshing
+            return key
+
+        # Unknown kid, either nothing has been fetched yet or the IdP rotated its keys
+        if self._refresh_task is None and not self._can_fetch(now):
+            return None
+        await asyncio.shield(self._schedule_refresh())
+        return self._keys.get(kid)
+
+    async def refresh(self):
+        """Fetches the key set now, joining the fetch already in flight if there is one."""
+        await asyncio.shield(self._schedule_refresh())
+
+    def _can_fetch(self, now):
+        return now - self._last_attempt >= self.min_refetch_interval
+
+    def _schedule_refresh(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._fetch_and_store())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    def _on_refresh_done(self, task):
+        self._refresh_task = None
+
+    async def _fetch_and_store(self):
+        self._last_attempt = time.monotonic()
+        try:
+            response = await http_client.get(self.jwks_url, timeout=self.fetch_timeout)
+            response.raise_for_status()
+            jwks = response.json()
+            keys = {
+                key["kid"]: {
+                    "kty": key["kty"],
+                    "kid": key["kid"],
+                    "use": key["use"],
+                    "n": key["n"],
+                    "e": key["e"]
+                }
+                for key in jwks["keys"]
+            }
+        except Exception as e:
+            if self._keys:
+                logger.warning(f"Unable to refresh JWKS from {self.jwks_url}, serving {len(self._keys)} cached keys: {e}")
+            else:
+                logger.error(f"Unable to fetch JWKS from {self.jwks_url}: {e}")
+            return
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        logger.info(f"JWKS refreshed from {self.jwks_url}: {len(keys)} keys")
@@ -1,17 +1,25 @@
 # api_utils.py
 
+import base64
+import heapq
 import math
 import os
+import re
 import threading
 
-from app_instance import logger
+from app_instance import app, logger
 from app.service import auth_service
 from app.model.api_response import ApiResponse
 from app.model.api_error_response import ErrorDetail, ApiErrorResponse
-from datetime import datetime
+from app.utils import json_codec
+from app.utils.custom_logger import set_log_context, reset_log_context
+from app.utils.resilience import DependencyUnavailableError
+from app.utils.sort_index_cache import SortIndexCache
+from datetime import date, datetime
+from functools import lru_cache
 from fastapi import Request, HTTPException
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import Response
+from urllib.parse import parse_qsl
 from uuid import uuid4
 
 
@@ -28,70 +36,129 @@ async def custom_handle_auth_error(request: Request, ex: auth_service.AuthError)
 
 
 # Define error handlers for HTTPException
-async def custom_handle_http_error(request: Request, exc: HTTPException) -> JSONResponse:
+async def custom_handle_http_error(request: Request, exc: HTTPException) -> Response:
     error_detail = ErrorDetail(code=exc.status_code, message=str(exc.detail))
     api_error_response = ApiErrorResponse(errors=[error_detail])
     logger.exception(f"HTTP error for {g_query_tracking_values_to_str(request)} - ERROR: {exc}")
     return api_error_response.to_response()
 
 
+# Error handler for calls to a dependency that failed fast: its circuit is open or it's over its concurrency limit
+async def custom_handle_dependency_error(request: Request, exc: DependencyUnavailableError) -> Response:
+    logger.error(f"Dependency unavailable for {g_query_tracking_values_to_str(request)} - ERROR: {exc}")
+    error_detail = ErrorDetail(code=503, message=str(exc))
+    api_error_response = ApiErrorResponse(errors=[error_detail])
+    return api_error_response.to_response()
+
+
 # Another generic handler
-async def custom_handle_generic_error(request: Request, exc: Exception) -> JSONResponse:
+async def custom_handle_generic_error(request: Request, exc: Exception) -> Response:
     logger.exception(f"Unhandled exception occurred: {exc}", exc_info=True)
     error_detail = ErrorDetail(code=500, message=str(exc))
     api_error_response = ApiErrorResponse(errors=[error_detail])
     return api_error_response.to_response()
 
 
-class RequestStateMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        # Check for both "request_id" and "requestId" in headers and query parameters
-        request_id = (
-                request.headers.get("request_id")
-                or request.headers.get("requestId")
-                or request.query_params.get("request_id")
-                or request.query_params.get("requestId")
-        )
-        request.state.request_id = request_id if request_id else str(uuid4())
-        # Check for both "session_id" and "sessionId" in headers and query parameters
-        session_id = (
-                request.headers.get("session_id")
-                or request.headers.get("sessionId")
-                or request.query_params.get("session_id")
-                or request.query_params.get("sessionId")
-        )
-        request.state.session_id = session_id if session_id else str(uuid4())
-        # Check for both "user_id" and "userId" in headers and query parameters
-        user_id = (
-                request.headers.get("user_id")
-                or request.headers.get("userId")
-                or request.query_params.get("user_id")
-                or request.query_params.get("userId")
-        )
-        request.state.user_id = user_id if user_id else ''
-        # Check for  "queryId" in path parameters
-        request.state.query = request.query_params.get("query", '')
+# Tracking ids can arrive as headers (lower-cased by the ASGI server) or as query parameters. Each name maps to
+# the request.state attribute it fills and its precedence: headers before query parameters, snake_case before camelCase
+TRACKING_HEADERS = {
+    b"request_id": ("request_id", 0),
+    b"requestid": ("request_id", 1),
+    b"session_id": ("session_id", 0),
+    b"sessionid": ("session_id", 1),
+    b"user_id": ("user_id", 0),
+    b"userid": ("user_id", 1),
+}
+TRACKING_QUERY_PARAMS = {
+    "request_id": ("request_id", 2),
+    "requestId": ("request_id", 3),
+    "session_id": ("session_id", 2),
+    "sessionId": ("session_id", 3),
+    "user_id": ("user_id", 2),
+    "userId": ("user_id", 3),
+}
+
+AGENT_ENDPOINTS = [
+    "/agent",
+    "/agentexp",
+    "/agentexpflash",
+    "/agentexpgpt35turbo",
+    "/agentexpgpt4omini",
+    "/agentexpgpt4o",
+    "/templates"
+]
+# Matches the first endpoint in AGENT_ENDPOINTS that prefixes the path, in the order they are listed
+AGENT_ENDPOINT_PATTERN = re.compile("|".join(re.escape(endpoint) for endpoint in AGENT_ENDPOINTS))
+
+
+def resolve_tracking_ids(scope):
+    """Resolves the request, session and user ids and the query of a request in one pass over its headers and query string."""
+    found = {}
+    for name, value in scope["headers"]:
+        tracking_id = TRACKING_HEADERS.get(name)
+        if tracking_id and value:
+            state_key, rank = tracking_id
+            if state_key not in found or rank < found[state_key][0]:
+                found[state_key] = (rank, value.decode("latin-1"))
+
+    query = ''
+    query_string = scope.get("query_string")
+    if query_string:
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+            if name == "query":
+                query = value
+                continue
+            tracking_id = TRACKING_QUERY_PARAMS.get(name)
+            if tracking_id and value:
+                state_key, rank = tracking_id
+                # The last occurrence of a repeated query parameter wins, as with request.query_params
+                if state_key not in found or rank <= found[state_key][0]:
+                    found[state_key] = (rank, value)
+
+    tracking_ids = {state_key: value for state_key, (rank, value) in found.items()}
+    tracking_ids["query"] = query
+    return tracking_ids
+
+
+class RequestStateMiddleware:
+    """Stores the tracking ids of each request in request.state and sets them as the log context.
+
+    This is a pure ASGI middleware: it reads the raw scope once instead of going through
+    BaseHTTPMiddleware, which wraps every request in an extra task and memory streams and
+    breaks backpressure on streaming responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracking_ids = resolve_tracking_ids(scope)
+        # request.state is backed by scope["state"]
+        state = scope.setdefault("state", {})
+        state["request_id"] = tracking_ids.get("request_id") or str(uuid4())
+        state["session_id"] = tracking_ids.get("session_id") or str(uuid4())
+        state["user_id"] = tracking_ids.get("user_id", '')
+        state["query"] = tracking_ids["query"]
+
         # Check for agent in path
-        agent_endpoints = [
-            "/agent",
-            "/agentexp",
-            "/agentexpflash",
-            "/agentexpgpt35turbo",
-            "/agentexpgpt4omini",
-            "/agentexpgpt4o",
-            "/templates"
-        ]
-        request_path = request.url.path
-        request.state.agent = ''  # Initialize the agent in request.state
-        for endpoint in agent_endpoints:
-            if request_path.startswith(endpoint):
-                request.state.agent = endpoint.lstrip('/')  # Set agent as the part after '/'
-                request.state.query_id = str(uuid4())
-                break
+        state["agent"] = ''
+        agent_match = AGENT_ENDPOINT_PATTERN.match(scope["path"])
+        if agent_match:
+            state["agent"] = agent_match.group().lstrip('/')  # Set agent as the part after '/'
+            state["query_id"] = str(uuid4())
 
-        # Proceed with the request
-        response = await call_next(request)
-        return response
+        # Each request runs in its own task, so the context set here is only seen by this request,
+        # including the code it hands to PropagatingThreadPoolExecutor and asyncio.to_thread()
+        token = set_log_context(request_id=state["request_id"], session_id=state["session_id"], user_id=state["user_id"], query_id=state.get("query_id", ''))
+        try:
+            # Proceed with the request
+            await self.app(scope, receive, send)
+        finally:
+            reset_log_context(token)
 
 
 
@@ -100,7 +167,18 @@ class RequestStateMiddleware(BaseHTTPMiddleware):
 
 
 def create_api_response(response_data, request: Request):
-    response = ApiResponse(
+    response = build_api_response(response_data, request)
+    return response.to_response()
+
+
+def create_streaming_api_response(response_data, request: Request, chunk_size=500):
+    """Streams the envelope with the items of an iterator or async iterator as 'data', so memory is bounded by chunk_size instead of the result size."""
+    response = build_api_response(response_data, request)
+    return response.to_streaming_response(chunk_size)
+
+
+def build_api_response(response_data, request: Request):
+    return ApiResponse(
         timestamp=datetime.utcnow().isoformat(),
         request_id=getattr(request.state, "request_id", ""),
         query_id=getattr(request.state, "query_id", ""),
@@ -110,9 +188,9 @@ def create_api_response(response_data, request: Request):
         total_elements=getattr(request.state, "total_elements", 0),
         current_page=getattr(request.state, "current_page", 1),
         page_size=getattr(request.state, "page_size", 10),
-        data=response_data
+        data=response_data,
+        next_cursor=getattr(request.state, "next_cursor", None)
     )
-    return response.to_response()
 
 
 def sorting(entry, request: Request):
@@ -126,7 +204,7 @@ def sorting(entry, request: Request):
 
     reverse = (sort_order == 'desc')
     try:
-        return sorted(entry, key=lambda x: x.get(sort_by) or '', reverse=reverse)
+        return sorted(entry, key=sort_key(sort_by), reverse=reverse)
     except TypeError as e:
         logger.error(f"Sorting failed due to field having data of different types: {e}. "
                      f"This field '{sort_by}' needs to be standardized to sort properly.")
@@ -154,6 +232,214 @@ def pagination(entry, request: Request):
     return paginated_entry
 
 
+# Above this fraction of the entries a page is deep enough that a full sort beats the heap
+TOP_K_MAX_FRACTION = 0.05
+
+# Sort orders of versioned datasets, reused across the pages of the same result set
+sort_index_cache = SortIndexCache(max_bytes=getattr(app.state, 'PAGINATION_SORT_INDEX_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+@lru_cache(maxsize=128)
+def sort_key(sort_by):
+    """Returns the key used to sort report entries by 'sort_by', entries without a value sort as ''."""
+    def key(report):
+        return report.get(sort_by) or ''
+    return key
+
+
+class EntryScan:
+    """Iterates the entries once, counting them and keeping the first 'head_size' of them in their original order."""
+
+    def __init__(self, entry, sort_by, head_size):
+        self.iterator = iter(entry)
+        self.sort_by = sort_by
+        self.head_size = head_size
+        self.head = []
+        self.count = 0
+        self.sort_field_found = False
+
+    def __iter__(self):
+        for report in self.iterator:
+            self.count += 1
+            if self.count <= self.head_size:
+                self.head.append(report)
+            if not self.sort_field_found and self.sort_by in report:
+                self.sort_field_found = True
+            yield report
+
+    def drain(self):
+        for _ in self:
+            pass
+
+
+def sort_and_paginate(entry, request: Request, dataset_version=None):
+    """Sorts and paginates the entry data in one step, based on the 'sort_by', 'sort_order', 'page' and 'page_size' query parameters.
+
+    Only the first page * page_size entries are kept, in a heap, so page k of size n costs O(N log(k*n))
+    instead of the O(N log N) of sorting() followed by pagination(). 'entry' can be any iterable, it is
+    consumed once and never materialized. Returns the same page as pagination(sorting(entry)).
+
+    When 'entry' is a list and 'dataset_version' is given, a token that changes whenever the list does,
+    its sort order is kept in sort_index_cache and the following pages are sliced from it.
+    """
+    page = int(request.query_params.get('page', 1))
+    page_size = int(request.query_params.get('page_size', 10))
+    if page == 0 and page_size == 0:
+        # The whole list was requested
+        entry = list(entry)
+        return pagination(sorting(entry, request), request)
+
+    sort_by = request.query_params.get('sort_by', 'created_at')  # Default sort by timestamp
+    sort_order = request.query_params.get('sort_order', 'asc')  # Default sort order is ascending
+    reverse = (sort_order == 'desc')
+    start = (page - 1) * page_size
+    end = max(start + page_size, 0)
+
+    if hasattr(entry, '__len__') and hasattr(entry, '__getitem__'):
+        # Sequences already know their size, and the field check stops at the first report that has it
+        total_elements = len(entry)
+        sort_field_found = any(sort_by in report for report in entry)
+        head = entry
+        scan = entry
+    else:
+        total_elements = None
+        head = None
+        scan = EntryScan(entry, sort_by, end)
+
+    try:
+        if end == 0:
+            paginated_entry = []
+        elif dataset_version is not None and total_elements is not None:
+            permutation = sort_index_cache.get_permutation(dataset_version, entry, sort_key(sort_by), sort_by, sort_order)
+            paginated_entry = [entry[index] for index in permutation[start:end]]
+        elif total_elements is not None and end > total_elements * TOP_K_MAX_FRACTION:
+            paginated_entry = sorted(scan, key=sort_key(sort_by), reverse=reverse)[start:end]
+        else:
+            top_k = heapq.nlargest if reverse else heapq.nsmallest
+            paginated_entry = top_k(end, scan, key=sort_key(sort_by))[start:end]
+    except TypeError as e:
+        logger.error(f"Sorting failed due to field having data of different types: {e}. "
+                     f"This field '{sort_by}' needs to be standardized to sort properly.")
+        # Fall back to the original order, as sorting() does
+        paginated_entry = (head if head is not None else scan.head)[start:end]
+
+    if total_elements is None:
+        scan.drain()  # The page is known, but the total still needs the rest of the entries
+        total_elements = scan.count
+        sort_field_found = scan.sort_field_found
+
+    # Log a warning if the sort field is not present in any report entries
+    if not sort_field_found:
+        logger.warning(f"Sort field '{sort_by}' not found in any report entries. Sorting may not work as expected.")
+
+    request.state.current_page = page
+    request.state.page_size = page_size
+    request.state.total_elements = total_elements
+    request.state.total_pages = math.ceil(total_elements / page_size) if page_size > 0 else 1
+    return paginated_entry
+
+
+def encode_cursor(sort_by, sort_order, sort_value, entry_id):
+    """Encodes the position of the last entry of a page as an opaque, URL-safe cursor.
+
+    Raises a 400 HTTPException when the sort value or the id can't be encoded, as the next page couldn't be found from it.
+    """
+    cursor = {"s": sort_by, "o": sort_order, "k": sort_value, "i": entry_id}
+    # Restored as a datetime or a date so it still compares with the entries
+    if isinstance(sort_value, datetime):
+        cursor["t"] = "datetime"
+    elif isinstance(sort_value, date):
+        cursor["t"] = "date"
+        cursor["k"] = sort_value.isoformat()
+    try:
+        return base64.urlsafe_b64encode(json_codec.dumps(cursor)).decode('ascii')
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Entries can't be paginated by cursor on '{sort_by}': {e}")
+
+
+def decode_cursor(cursor, sort_by, sort_order):
+    """Decodes a cursor built by encode_cursor into its (sort_value, entry_id) position.
+
+    Database backends can use the position directly in their keyset query, e.g. WHERE (sort_by, id) > (sort_value, entry_id).
+    """
+    try:
+        decoded = json_codec.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        sort_value = decoded["k"]
+        if decoded.get("t") == "datetime":
+            sort_value = datetime.fromisoformat(sort_value)
+        elif decoded.get("t") == "date":
+            sort_value = date.fromisoformat(sort_value)
+        position = (sort_value, decoded["i"])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    if decoded.get("s") != sort_by or decoded.get("o") != sort_order:
+        raise HTTPException(status_code=400, detail="The cursor was issued for a different sort_by or sort_order")
+    return position
+
+
+def keyset_pagination(entry, request: Request, id_field='id'):
+    """Paginates the entry data by position instead of by offset, based on the 'cursor', 'sort_by', 'sort_order' and 'page_size' query parameters.
+
+    Entries are ordered by (sort_by, id_field), the id breaking ties, and each page starts right after the
+    position encoded in 'cursor'. The cursor for the following page is stored in request.state.next_cursor
+    and returned as 'nextCursor' in the envelope, which leaves it out on the last page. The total count is only
+    computed when the caller asks for it with include_total=true.
+    """
+    sort_by = request.query_params.get('sort_by', 'created_at')  # Default sort by timestamp
+    sort_order = request.query_params.get('sort_order', 'asc')  # Default sort order is ascending
+    page_size = int(request.query_params.get('page_size', 10))
+    cursor = request.query_params.get('cursor')
+    include_total = request.query_params.get('include_total', 'false').lower() == 'true'
+    reverse = (sort_order == 'desc')
+
+    key = sort_key(sort_by)
+
+    def position(report):
+        return (key(report), report.get(id_field, ''))
+
+    sized = hasattr(entry, '__len__')
+    scan = entry if sized or not include_total else EntryScan(entry, sort_by, 0)
+    candidates = scan
+    if cursor:
+        after = decode_cursor(cursor, sort_by, sort_order)
+        if reverse:
+            candidates = (report for report in scan if position(report) < after)
+        else:
+            candidates = (report for report in scan if position(report) > after)
+
+    top_k = heapq.nlargest if reverse else heapq.nsmallest
+    try:
+        # One extra entry tells whether there is a next page
+        paginated_entry = top_k(max(page_size, 0) + 1, candidates, key=position)
+    except TypeError as e:
+        logger.error(f"Keyset pagination failed due to field having data of different types: {e}. "
+                     f"This field '{sort_by}' needs to be standardized to sort properly.")
+        raise HTTPException(status_code=400, detail=f"Entries can't be ordered by '{sort_by}'")
+
+    next_cursor = None
+    if len(paginated_entry) > page_size:
+        paginated_entry = paginated_entry[:page_size]
+        if paginated_entry:
+            sort_value, entry_id = position(paginated_entry[-1])
+            # Entries without an id would all tie on the same position, and the next page would skip those after the cursor
+            if entry_id in ('', None):
+                raise HTTPException(status_code=400, detail=f"Entries need an '{id_field}' to be paginated by cursor")
+            next_cursor = encode_cursor(sort_by, sort_order, sort_value, entry_id)
+
+    request.state.next_cursor = next_cursor
+    request.state.page_size = page_size
+    request.state.current_page = None
+    request.state.total_elements = None
+    request.state.total_pages = None
+    if include_total:
+        if not sized:
+            scan.drain()
+        total_elements = len(entry) if sized else scan.count
+        request.state.total_elements = total_elements
+        request.state.total_pages = math.ceil(total_elements / page_size) if page_size > 0 else 1
+    return paginated_entry
+
+
 def g_query_tracking_values_to_str(request: Request):
     """Generates a string from the tracking values for logging."""
     request_id = request.state.request_id if hasattr(request.state, "request_id") else "REQUEST_ID_MISSING"
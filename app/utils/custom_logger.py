@@ -1,56 +1,108 @@
-import inspect
+import contextvars
 import logging
 import os
+import sys
 import threading
 from fastapi import Request
 
+# Legacy per-thread context, read when no log context is set through set_log_context()
 thread_local = threading.local()
 
 # Determine the environment from an environment variable
 defaultEnvironment = 'local'
 environment = os.getenv('ENVIRONMENT', defaultEnvironment)
 
+
+def render_log_prefix(request_id='', session_id='', user_id='', query_id=''):
+    parts = []
+    if request_id:
+        parts.append(f"[request_id: {request_id}]")
+    if session_id:
+        parts.append(f"[session_id: {session_id}]")
+    if user_id:
+        parts.append(f"[user_id: {user_id}]")
+    if query_id:
+        parts.append(f"[query_id: {query_id}]")
+    return " ".join(parts)
+
+
+class LogContext:
+    """Correlation ids of the request or message being processed.
+
+    The log prefix is rendered once when the context is created, so records logged under the same
+    context reuse the same string. Treat instances as immutable and set a new context to change the ids.
+    """
+
+    __slots__ = ('request_id', 'session_id', 'user_id', 'query_id', 'prefix')
+
+    def __init__(self, request_id='', session_id='', user_id='', query_id=''):
+        self.request_id = request_id or ''
+        self.session_id = session_id or ''
+        self.user_id = user_id or ''
+        self.query_id = query_id or ''
+        self.prefix = render_log_prefix(self.request_id, self.session_id, self.user_id, self.query_id)
+
+    @classmethod
+    def from_dict(cls, context):
+        # Accepts both the snake_case and camelCase keys used by callers of the legacy thread_local context
+        return cls(
+            request_id=context.get('request_id', ''),
+            session_id=context.get('session_id', ''),
+            user_id=context.get('user_id', '') or context.get('userId', ''),
+            query_id=context.get('query_id', '') or context.get('queryId', ''),
+        )
+
+    def as_dict(self):
+        return {'request_id': self.request_id, 'session_id': self.session_id, 'user_id': self.user_id, 'query_id': self.query_id}
+
+
+# Follows the code across await points, asyncio tasks and, through PropagatingThreadPoolExecutor
+# and asyncio.to_thread(), into worker threads. Each request or message sets its own value.
+log_context = contextvars.ContextVar('log_context', default=None)
+
+
+def set_log_context(context=None, **ids):
+    """Sets the log context of the current task or thread and returns the token to reset it with.
+
+    Takes a LogContext, a dict in the legacy thread_local format, or the ids as keyword arguments.
+    """
+    if context is None:
+        context = LogContext(**ids)
+    elif isinstance(context, dict):
+        context = LogContext.from_dict(context)
+    return log_context.set(context)
+
+
+def reset_log_context(token):
+    log_context.reset(token)
+
+
+def get_log_context():
+    """Returns the current LogContext, falling back to the legacy thread_local context, or None."""
+    context = log_context.get()
+    if context is not None:
+        return context
+    legacy_context = getattr(thread_local, 'context', None)
+    return LogContext.from_dict(legacy_context) if legacy_context else None
+
+
 # Ensure you clear the context when done processing a message
 def clear_thread_local_context():
+    log_context.set(None)
     if hasattr(thread_local, 'context'):
         del thread_local.context
 
 # Extracted function to handle building context
 def build_log_prefix(request: Request = None):
-    parts = []
-
     if request:
-        request_id = getattr(request.state, 'request_id', '')
-        session_id = getattr(request.state, 'session_id', '')
-        user_id = getattr(request.state, 'user_id', '')
-        query_id = getattr(request.state, 'query_id', '')
-
-        if request_id:
-            parts.append(f"[request_id: {request_id}]")
-        if session_id:
-            parts.append(f"[session_id: {session_id}]")
-        if user_id:
-            parts.append(f"[user_id: {user_id}]")
-        if query_id:
-            parts.append(f"[query_id: {query_id}]")
-
-    elif getattr(thread_local, 'context', None):
-        thread_context = thread_local.context
-        request_id = thread_context.get('request_id', '')
-        session_id = thread_context.get('session_id', '')
-        user_id = thread_context.get('user_id', '') or thread_context.get('userId', '')
-        query_id = thread_context.get('query_id', '') or thread_context.get('queryId', '')
-
-        if request_id:
-            parts.append(f"[request_id: {request_id}]")
-        if session_id:
-            parts.append(f"[session_id: {session_id}]")
-        if user_id:
-            parts.append(f"[user_id: {user_id}]")
-        if query_id:
-            parts.append(f"[query_id: {query_id}]")
-
-    return " ".join(parts)
+        return render_log_prefix(
+            getattr(request.state, 'request_id', ''),
+            getattr(request.state, 'session_id', ''),
+            getattr(request.state, 'user_id', ''),
+            getattr(request.state, 'query_id', ''),
+        )
+    context = get_log_context()
+    return context.prefix if context else ""
 
 class CustomLogger(logging.getLoggerClass()):
     def build_msg(self, msg, request: Request = None):
@@ -58,18 +110,23 @@ class CustomLogger(logging.getLoggerClass()):
         return f"{prefix} {msg}" if prefix else msg
 
     def _log_with_stacklevel(self, level, msg, *args, request: Request = None, exc_info=None, **kwargs):
+        # Skip building the context prefix and resolving the caller when the record would be discarded
+        if not self.isEnabledFor(level):
+            return
+
         msg = self.build_msg(msg, request)
 
         if exc_info:
             kwargs['exc_info'] = exc_info
 
         if 'stacklevel' not in kwargs:
-            frame_info = inspect.stack()
+            # Walk up from the caller until the first frame outside this module. Unlike inspect.stack(),
+            # this doesn't build frame info for the whole stack or read source lines from disk
+            frame = sys._getframe(1)
             stacklevel = 2
-            for i, frame in enumerate(frame_info):
-                if 'custom_logger.py' not in frame.filename:
-                    stacklevel = i + 1
-                    break
+            while frame is not None and frame.f_code.co_filename == _srcfile:
+                frame = frame.f_back
+                stacklevel += 1
             kwargs['stacklevel'] = stacklevel
 
         super().log(level, msg, *args, **kwargs)
@@ -108,9 +165,13 @@ class CustomLogger(logging.getLoggerClass()):
     #
     #     # Implement your PostHog event capture logic here
 
+# Frames from this module are skipped when resolving the caller of a log call
+_srcfile = CustomLogger._log_with_stacklevel.__code__.co_filename
+
+
 class ContextualFilter(logging.Filter):
     def filter(self, record):
-        prefix = build_log_prefix()
-        if prefix:
-            record.msg = f"{prefix} {record.msg}"
+        context = get_log_context()
+        if context is not None and context.prefix:
+            record.msg = f"{context.prefix} {record.msg}"
         return True
@@ -1,24 +1,185 @@
-from concurrent.futures import ThreadPoolExecutor
-from custom_logger import thread_local
+import contextvars
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from app.utils.custom_logger import thread_local
+
+OVERFLOW_POLICIES = ('block', 'reject', 'caller_runs')
+
+# Named executors, for executor_metrics()
+_executors = weakref.WeakValueDictionary()
+
+
+class ExecutorRejectedError(RuntimeError):
+    """Raised by submit() when the executor's queue is full and the task can't be accepted."""
 
 
 class PropagatingThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs each task in the submitter's context, with an optional bounded queue.
+
+    With 'max_queue_size', at most max_workers + max_queue_size tasks are queued or running at once.
+    When that limit is reached, 'overflow_policy' decides what submit() does:
+      - 'block': waits for a slot, up to 'submit_timeout' seconds, then raises ExecutorRejectedError
+      - 'reject': raises ExecutorRejectedError
+      - 'caller_runs': runs the task on the calling thread, which slows the producer down
+    """
+
+    def __init__(self, max_workers=None, thread_name_prefix='', initializer=None, initargs=(), name=None,
+                 max_queue_size=None, overflow_policy='block', submit_timeout=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow_policy}")
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix or (name or ''),
+                         initializer=initializer, initargs=initargs)
+        self.name = name or thread_name_prefix or f"executor-{id(self)}"
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.submit_timeout = submit_timeout
+        self._slots = threading.Semaphore(self._max_workers + max_queue_size) if max_queue_size is not None else None
+
+        self._metrics_lock = threading.Lock()
+        self._active = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.caller_runs = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+        self.run_time_max = 0.0
+        if name:
+            _executors[name] = self
+
     def submit(self, fn, *args, **kwargs):
-        # Capture the current thread's context
-        context = getattr(thread_local, 'context', None)
+        # Capture the submitting code's context: the log context and any other context variables
+        context = contextvars.copy_context()
+        # Legacy per-thread context, for code that still sets custom_logger.thread_local.context
+        legacy_context = getattr(thread_local, 'context', None)
+
+        if self._slots is not None and not self._acquire_slot():
+            if self.overflow_policy != 'caller_runs':
+                with self._metrics_lock:
+                    self.rejected += 1
+                raise ExecutorRejectedError(f"Executor {self.name} is full ({self._max_workers} workers, {self.max_queue_size} queued)")
+            with self._metrics_lock:
+                self.caller_runs += 1
+            return self._run_in_caller(context, fn, args, kwargs)
+
+        submitted_at = time.perf_counter()
 
         # Wrapper function to run with the captured context
         def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            self._task_started(started_at - submitted_at)
             # Set the context in the new thread
-            thread_local.context = context
+            if legacy_context is not None:
+                thread_local.context = legacy_context
             try:
-                return fn(*args, **kwargs)
+                return context.run(fn, *args, **kwargs)
             finally:
                 # Clean up context after task completion
                 if hasattr(thread_local, 'context'):
                     del thread_local.context
+                self._task_finished(time.perf_counter() - started_at)
+
+        with self._metrics_lock:
+            self.submitted += 1
+        try:
+            # Submit the task to the ThreadPoolExecutor. The arguments are passed through unchanged,
+            # the Pub/Sub ThreadScheduler reads the message back from the queued work items on shutdown
+            future = super().submit(wrapper, *args, **kwargs)
+        except BaseException:
+            with self._metrics_lock:
+                self.submitted -= 1
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        if self._slots is not None:
+            # Also releases the slot of tasks cancelled before they started
+            future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _acquire_slot(self):
+        if self.overflow_policy == 'block':
+            return self._slots.acquire(timeout=self.submit_timeout)
+        return self._slots.acquire(blocking=False)
+
+    def _run_in_caller(self, context, fn, args, kwargs):
+        future = Future()
+        started_at = time.perf_counter()
+        try:
+            result = context.run(fn, *args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        run_time = time.perf_counter() - started_at
+        with self._metrics_lock:
+            self.run_time_total += run_time
+            self.run_time_max = max(self.run_time_max, run_time)
+            self.completed += 1
+        return future
+
+    def _task_started(self, wait_time):
+        with self._metrics_lock:
+            self._active += 1
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def _task_finished(self, run_time):
+        with self._metrics_lock:
+            self._active -= 1
+            self.completed += 1
+            self.run_time_total += run_time
+            self.run_time_max = max(self.run_time_max, run_time)
+
+    def grow(self, max_workers):
+        """Raises the worker limit to 'max_workers', the extra threads start as tasks arrive. Pools never shrink."""
+        with self._metrics_lock:
+            added = max_workers - self._max_workers
+            if added <= 0:
+                return
+            self._max_workers = max_workers
+        if self._slots is not None:
+            self._slots.release(added)
+
+    def drain(self, timeout=None):
+        """Stops accepting tasks and waits up to 'timeout' seconds for the queued and running ones to finish.
+
+        Returns True when the executor drained. On timeout, the tasks that haven't started are cancelled
+        and False is returned; running tasks can't be interrupted and keep going.
+        """
+        self.shutdown(wait=False)
+        # The workers exit once the queue is empty, like shutdown(wait=True) but with a deadline
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in list(self._threads):
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        drained = not any(thread.is_alive() for thread in self._threads)
+        if not drained:
+            self.shutdown(wait=False, cancel_futures=True)
+        return drained
 
-        # Submit the task to the ThreadPoolExecutor
-        return super().submit(wrapper, *args, **kwargs)
+    def metrics(self):
+        with self._metrics_lock:
+            started = self.completed - self.caller_runs + self._active
+            return {
+                "name": self.name,
+                "max_workers": self._max_workers,
+                "max_queue_size": self.max_queue_size,
+                # After shutdown the queue also holds the None that tells the workers to exit
+                "queue_depth": max(0, self._work_queue.qsize() - (1 if self._shutdown else 0)),
+                "active_workers": self._active,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "caller_runs": self.caller_runs,
+                "wait_time_avg": self.wait_time_total / started if started else 0.0,
+                "wait_time_max": self.wait_time_max,
+                "run_time_avg": self.run_time_total / self.completed if self.completed else 0.0,
+                "run_time_max": self.run_time_max,
+            }
 
 
+def executor_metrics():
+    """Returns the metrics of every executor created with a name, keyed by name."""
+    return {name: executor.metrics() for name, executor in list(_executors.items())}
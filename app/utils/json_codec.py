@@ -0,0 +1,83 @@
+# json_codec.py
+
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library encoder is used without it
+    orjson = None
+else:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+def serialize_datetime(obj):
+    """
+    Custom function to serialize datetime.datetime objects.
+    Args:
+        obj: object to be JSON serialized
+    Returns:
+        JSON serializable version of obj
+    """
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError("Type not serializable")
+
+
+def _orjson_dumps(obj, default=serialize_datetime):
+    # Datetimes and dataclasses go through 'default', so they keep the behaviour of the standard library path
+    try:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+    except orjson.JSONEncodeError:
+        # Ints beyond 64 bits among others: the standard library encodes them, or raises the error it always did
+        return _json_dumps(obj, default)
+
+
+def _json_dumps(obj, default=serialize_datetime):
+    # The arguments Starlette's JSONResponse rendered with
+    return json.dumps(obj, default=default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data):
+    return json.loads(data)
+
+
+def set_backend(name):
+    """Selects the JSON backend used by dumps() and loads(): 'orjson' or 'json'."""
+    global backend, dumps, loads
+    if name == "orjson" and orjson is not None:
+        backend, dumps, loads = "orjson", _orjson_dumps, orjson.loads
+    elif name in ("orjson", "json"):
+        backend, dumps, loads = "json", _json_dumps, _json_loads
+    else:
+        raise ValueError(f"Unknown JSON backend: {name}")
+
+
+# dumps(obj) -> compact UTF-8 bytes, loads(bytes or str) -> object
+#
+# Both backends decode to the same values as Starlette's JSONResponse output, and the standard library one
+# writes the same bytes. orjson differs: floats in exponent notation are written without a '+' or leading
+# zeros in the exponent (1e16, 1e-7 for 1e+16, 1e-07), NaN and Infinity are written as null instead of
+# raising ValueError, and UUIDs and enums are encoded instead of raising TypeError. Consumers comparing
+# bytes or rejecting null need set_backend("json").
+backend, dumps, loads = None, None, None
+set_backend("orjson")
+
+
+def loads_many(documents):
+    """Decodes a list of JSON documents, returns (values, indexes of the invalid ones).
+
+    Empty and invalid documents decode to None. Module level so process pools can run it.
+    """
+    values = []
+    invalid = []
+    for index, document in enumerate(documents):
+        if not document:
+            values.append(None)
+            continue
+        try:
+            values.append(loads(document))
+        except ValueError:
+            values.append(None)
+            invalid.append(index)
+    return values, invalid
@@ -0,0 +1,77 @@
+# lru_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with optional per-entry expiry and hit/miss counters.
+
+    Entries expire at the absolute epoch time given to set(), or 'ttl' seconds after being stored
+    when no expiry is given. Expired entries count as misses and are dropped when looked up.
+    With 'max_bytes', the cache is also bounded by the total size of its values as measured by 'sizeof'.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at, size = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.size_bytes -= size
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= previous[2]
+            self._entries[key] = (value, expires_at, size)
+            self.size_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size_bytes > self.max_bytes)):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= entry[2]
+        return default if entry is None else entry[0]
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        return {"size": len(self._entries), "bytes": self.size_bytes, "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self._entries)
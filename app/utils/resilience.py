@@ -0,0 +1,228 @@
+# resilience.py
+
+import functools
+import inspect
+import threading
+import time
+
+from app_instance import app, logger
+
+# States of a CircuitBreaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DependencyUnavailableError(RuntimeError):
+    """A call to a dependency failed fast, without being sent."""
+
+    def __init__(self, endpoint, message):
+        super().__init__(f"{endpoint}: {message}")
+        self.endpoint = endpoint
+
+
+class CircuitOpenError(DependencyUnavailableError):
+    pass
+
+
+class LoadShedError(DependencyUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    """Fails calls fast after 'failure_threshold' consecutive failures.
+
+    Once open, calls are rejected for 'reset_timeout' seconds, then a single trial call is let
+    through: its success closes the circuit, its failure opens it for another 'reset_timeout'.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def on_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+
+    def on_failure(self):
+        """Returns True when this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state != OPEN and (self.state == HALF_OPEN or self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+    def cancel_trial(self):
+        """The trial call wasn't sent after all, the next call gets to be the trial."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+
+class AdaptiveLimiter:
+    """AIMD limit on the calls in flight, driven by their latency.
+
+    A call that succeeds under 'latency_target' while at least half the limit is in use raises the
+    limit by one; a failure or a slower call cuts it by 'backoff_ratio'. Calls over the limit are
+    shed right away instead of queueing behind a slow dependency.
+    """
+
+    def __init__(self, initial_limit=50, min_limit=1, max_limit=200, latency_target=1.0, backoff_ratio=0.9):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, failed):
+        with self._lock:
+            if failed or latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            elif self.in_flight * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1)
+            self.in_flight -= 1
+
+
+class ResiliencePolicy:
+    """Circuit breaker and adaptive concurrency limit of one endpoint.
+
+    acquire() raises CircuitOpenError or LoadShedError when the call shouldn't be sent, and returns a
+    token to hand to release() with the outcome once it completes. call() and acall() do both around
+    a sync function or a coroutine function, counting any exception as a failure.
+    """
+
+    def __init__(self, endpoint, breaker, limiter):
+        self.endpoint = endpoint
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def acquire(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.endpoint, "circuit open after repeated failures")
+        if not self.limiter.try_acquire():
+            self.breaker.cancel_trial()
+            raise LoadShedError(self.endpoint, f"{self.limiter.in_flight} calls in flight, over the limit of {int(self.limit)}")
+        return time.perf_counter()
+
+    def release(self, token, failed):
+        self.limiter.release(time.perf_counter() - token, failed)
+        if failed:
+            if self.breaker.on_failure():
+                logger.warning(f"Circuit of {self.endpoint} open after {self.breaker.failures} consecutive failures")
+        else:
+            self.breaker.on_success()
+
+    def call(self, func, *args, **kwargs):
+        token = self.acquire()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self.release(token, failed)
+
+    async def acall(self, func, *args, **kwargs):
+        token = self.acquire()
+        failed = True
+        try:
+            result = await func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self.release(token, failed)
+
+    @property
+    def limit(self):
+        return self.limiter.limit
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "shed": self.limiter.shed,
+        }
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_policy(endpoint):
+    """The policy of 'endpoint', created on first use with the settings of the resilience config."""
+    policy = _policies.get(endpoint)
+    if policy is None:
+        with _policies_lock:
+            policy = _policies.get(endpoint)
+            if policy is None:
+                breaker = CircuitBreaker(
+                    failure_threshold=getattr(app.state, 'RESILIENCE_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(app.state, 'RESILIENCE_RESET_TIMEOUT', 30),
+                )
+                limiter = AdaptiveLimiter(
+                    initial_limit=getattr(app.state, 'RESILIENCE_INITIAL_LIMIT', 50),
+                    min_limit=getattr(app.state, 'RESILIENCE_MIN_LIMIT', 1),
+                    max_limit=getattr(app.state, 'RESILIENCE_MAX_LIMIT', 200),
+                    latency_target=getattr(app.state, 'RESILIENCE_LATENCY_TARGET_MS', 1000) / 1000,
+                    backoff_ratio=getattr(app.state, 'RESILIENCE_BACKOFF_RATIO', 0.9),
+                )
+                policy = _policies[endpoint] = ResiliencePolicy(endpoint, breaker, limiter)
+    return policy
+
+
+def resilience_stats():
+    with _policies_lock:
+        policies = list(_policies.values())
+    return {policy.endpoint: policy.stats() for policy in policies}
+
+
+def resilient(func=None, endpoint=None):
+    """Decorator running a sync or async function under the policy of 'endpoint' (by default the function's name).
+
+    Use as @resilient or @resilient(endpoint="stripe") to share the policy between the functions calling one dependency.
+    """
+    def decorator(func):
+        policy = get_policy(endpoint or func.__qualname__)
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await policy.acall(func, *args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return policy.call(func, *args, **kwargs)
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
@@ -0,0 +1,42 @@
+# sort_index_cache.py
+
+from array import array
+
+from app.utils.lru_cache import LRUCache
+
+
+class SortIndexCache:
+    """Caches the sort order of datasets as permutation arrays, keyed by (dataset_version, sort_by, direction).
+
+    Clients that page through the same result set get every page after the first as an O(page_size)
+    slice of the stored permutation instead of a new sort. Callers pass a version token that changes
+    whenever the dataset does, so stale orders are never served; the cache is bounded by the memory of
+    its permutations and evicts the least recently used ones.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self._cache = LRUCache(max_entries=1024, max_bytes=max_bytes, sizeof=lambda permutation: permutation.itemsize * len(permutation))
+
+    def get_permutation(self, dataset_version, entry, key, sort_by, sort_order):
+        """Returns the indexes of 'entry' in sorted order, sorting and storing them on a miss.
+
+        Raises TypeError when the sort field holds values that can't be compared, as sorted() does.
+        """
+        # Keyed by the direction rather than the raw parameter, so 'ASC', 'asc' and 'Asc' share one permutation
+        reverse = (sort_order == 'desc')
+        cache_key = (dataset_version, sort_by, reverse)
+        permutation = self._cache.get(cache_key)
+        if permutation is None or len(permutation) != len(entry):
+            sort_keys = [key(report) for report in entry]
+            permutation = array('I', sorted(range(len(entry)), key=sort_keys.__getitem__, reverse=reverse))
+            self._cache.set(cache_key, permutation)
+        return permutation
+
+    def invalidate(self, dataset_version):
+        """Drops every sort order stored for the given dataset version."""
+        for cache_key in self._cache.keys():
+            if cache_key[0] == dataset_version:
+                self._cache.pop(cache_key)
+
+    def stats(self):
+        return self._cache.stats()
@@ -1,13 +1,17 @@
 # app_instance.py
 
+import asyncio
+import inspect
 import logging  # Add this line
 import os
 import re
 import yaml
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.utils.custom_logger import CustomLogger, ContextualFilter
+from app.utils.custom_thread_pool_executor import PropagatingThreadPoolExecutor
 from logging_config import setup_logging_gcp, setup_logging_local
 
 
@@ -22,6 +26,14 @@ defaultProjectId = 'daring-keep-408013'
 defaultLocation = 'us-central1'
 environment = os.getenv('FLASK_ENV', defaultEnvironment)
 
+# Opt-in queued logging: records are written by a background thread in batches instead of on the calling thread.
+# When the queue is full, records are dropped ('drop') or the caller waits ('block')
+LOG_QUEUE_OPTIONS = {
+    'queued': os.getenv('LOG_QUEUED', 'false').lower() == 'true',
+    'queue_size': int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    'overflow_policy': os.getenv('LOG_QUEUE_OVERFLOW_POLICY', 'drop'),
+}
+
 
 
 
@@ -30,17 +42,43 @@ environment = os.getenv('FLASK_ENV', defaultEnvironment)
 
 # Call setup_logging before defining logger
 if environment != 'local':
-    setup_logging_gcp(LOG_LEVEL)  # Setup logging before the app starts
+    setup_logging_gcp(LOG_LEVEL, **LOG_QUEUE_OPTIONS)  # Setup logging before the app starts
 else:
-    setup_logging_local(LOG_LEVEL)
+    setup_logging_local(LOG_LEVEL, **LOG_QUEUE_OPTIONS)
 logger = logging.getLogger(__name__)  # Add this line to get the logger
 
 
 
 
 
+# Callables run in order on the event loop when the app starts, before the first request is served; coroutines are awaited
+startup_hooks = []
+# Callables run in order when the app shuts down, after the last request was served. Coroutine functions are
+# awaited on the event loop, blocking ones run in a thread
+shutdown_hooks = []
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # loop.run_in_executor(None, ...) doesn't copy the caller's context, the default executor does it instead
+    asyncio.get_running_loop().set_default_executor(PropagatingThreadPoolExecutor(thread_name_prefix='asyncio'))
+    for hook in startup_hooks:
+        result = hook()
+        if inspect.isawaitable(result):
+            await result
+    yield
+    for hook in shutdown_hooks:
+        try:
+            if inspect.iscoroutinefunction(hook):
+                await hook()
+            else:
+                await asyncio.to_thread(hook)
+        except Exception as e:
+            logger.error(f"Shutdown hook {getattr(hook, '__name__', hook)} failed: {type(e).__name__} – {e}")
+
+
 # logger.error("APP_INSTANCE INTIALIZATION")
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 # Enable CORS
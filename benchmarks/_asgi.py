@@ -0,0 +1,83 @@
+# _asgi.py
+
+# Helpers shared by the benchmarks: build the service's FastAPI app without starting the
+# Pub/Sub and gRPC threads, and drive it in-process through the raw ASGI interface.
+
+import asyncio
+import logging
+import time
+
+from fastapi import FastAPI, HTTPException
+
+
+def build_app(middleware_class=None):
+    """Builds an app wired like python_base_service.py, without the background services."""
+    from app.controller.controller import router
+    from app.service import auth_service
+    from app.utils.api_utils import RequestStateMiddleware, custom_handle_auth_error, custom_handle_http_error, custom_handle_dependency_error, custom_handle_generic_error
+    from app.utils.resilience import DependencyUnavailableError
+
+    app = FastAPI()
+    app.include_router(router)
+    app.add_middleware(middleware_class or RequestStateMiddleware)
+    app.add_exception_handler(auth_service.AuthError, custom_handle_auth_error)
+    app.add_exception_handler(HTTPException, custom_handle_http_error)
+    app.add_exception_handler(DependencyUnavailableError, custom_handle_dependency_error)
+    app.add_exception_handler(Exception, custom_handle_generic_error)
+    return app
+
+
+def quiet_logging():
+    """The request handlers log several lines per call, which would dominate the measurements."""
+    logging.getLogger().setLevel(logging.WARNING)
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.WARNING)
+
+
+async def asgi_get(app, path, headers=None, query_string="", collect_body=True):
+    """Runs one GET request through the app and returns (status, body, seconds_to_first_body_byte).
+
+    With collect_body=False the body is discarded as it arrives and its length is returned instead.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8080),
+    }
+    start = time.perf_counter()
+    result = {"status": None, "body": [], "length": 0, "first_byte": None, "request_sent": False}
+    response_complete = asyncio.Event()
+
+    async def receive():
+        if not result["request_sent"]:
+            result["request_sent"] = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for a disconnect while they send, it only comes once the response is done
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            if result["first_byte"] is None and message.get("body"):
+                result["first_byte"] = time.perf_counter() - start
+            if collect_body:
+                result["body"].append(message.get("body", b""))
+            else:
+                result["length"] += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_complete.set()
+
+    await app(scope, receive, send)
+    body = b"".join(result["body"]) if collect_body else result["length"]
+    return result["status"], body, result["first_byte"]
@@ -0,0 +1,120 @@
+# bench_auth_jwks.py
+
+# Measures /api/v2/private throughput with a local stand-in for the IdP's JWKS endpoint.
+# "legacy" downloads the key set with a blocking urlopen on every request (the old behaviour),
+# "store" uses the cached JwksKeyStore, and "store+cache" also skips the signature check for
+# tokens that were already verified.
+#
+#   python -m benchmarks.bench_auth_jwks --requests 500 --concurrency 50 --jwks-latency-ms 50
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+import rsa
+from jose import jwt
+
+from benchmarks._asgi import asgi_get, build_app, quiet_logging
+
+KID = "benchmark-key"
+
+
+def b64url_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def start_jwks_server(public_key, latency_ms):
+    body = json.dumps({"keys": [{
+        "kty": "RSA", "kid": KID, "use": "sig", "alg": "RS256",
+        "n": b64url_uint(public_key.n), "e": b64url_uint(public_key.e),
+    }]}).encode()
+
+    class JwksHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)  # Stand-in for the round trip to the IdP
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JwksHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/.well-known/jwks.json"
+
+
+class LegacyJwks:
+    """Reproduces the previous behaviour: one blocking download per authenticated request."""
+
+    def __init__(self, jwks_url):
+        self.jwks_url = jwks_url
+
+    async def get_key(self, kid):
+        jwks = json.loads(urlopen(self.jwks_url).read())
+        for key in jwks["keys"]:
+            if key["kid"] == kid:
+                return {field: key[field] for field in ("kty", "kid", "use", "n", "e")}
+        return {}
+
+
+async def run(app, token, total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def one():
+        async with semaphore:
+            status, _, _ = await asgi_get(app, "/api/v2/private", headers=headers)
+            assert status == 200, status
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--jwks-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    os.environ["ENVIRONMENT"] = "development"  # requires_auth skips verification in 'local'
+    from app.service import auth_service
+    from app.service.jwks_key_store import JwksKeyStore
+    from app.utils.lru_cache import LRUCache
+
+    quiet_logging()
+    public_key, private_key = rsa.newkeys(2048)
+    jwks_url = start_jwks_server(public_key, args.jwks_latency_ms)
+    token = jwt.encode(
+        {"sub": "benchmark", "aud": auth_service.API_AUDIENCE, "iss": f"https://{auth_service.AUTH0_DOMAIN}/", "exp": int(time.time()) + 3600},
+        private_key.save_pkcs1().decode(),
+        algorithm="RS256",
+        headers={"kid": KID},
+    )
+    app = build_app()
+
+    modes = (
+        ("legacy", LegacyJwks(jwks_url), 0),
+        ("store", JwksKeyStore(jwks_url), 0),
+        ("store+cache", JwksKeyStore(jwks_url), 10000),
+    )
+    for mode, store, token_cache_size in modes:
+        auth_service.jwks_store = store
+        auth_service.token_cache = LRUCache(max_entries=token_cache_size)
+        rps = asyncio.run(run(app, token, args.requests, args.concurrency))
+        print(f"{mode:>12}: {rps:10.1f} req/s  ({args.requests} requests, concurrency {args.concurrency}, JWKS latency {args.jwks_latency_ms} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench_bulk_ingest.py
+
+# Objects per second ingesting ObjectExample batches at different batch sizes.
+#   In process: json.loads of each jsonData one at a time (what implementations did), BulkIngestor
+#   decoding a chunk at a time, and BulkIngestor decoding the chunks in a process pool.
+#   Over gRPC, against the thread server in its own process: --total objects sent as unary
+#   ExampleCallReturnsEmpty batches vs one IngestObjectExamples client stream of batches. Messages
+#   over the server's max_receive_message_length fail, in both cases.
+#
+#   python -m benchmarks.bench_bulk_ingest --json-bytes 200 --batch-sizes 100,1000,10000,100000 --total 200000
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks._asgi import quiet_logging
+
+
+def build_objects(count, json_bytes):
+    from app.proto.gen import BaseModel1_pb2
+
+    document = json.dumps({"amount": 12.5, "currency": "EUR", "description": "x" * max(0, json_bytes - 50)})
+    return [BaseModel1_pb2.ObjectExample(userId="user", reportId="report", transactionId=str(i),
+                                         jsonData=document, transactionDate="2024-01-01") for i in range(count)]
+
+
+def one_at_a_time(objects):
+    for item in objects:
+        json.loads(item.jsonData)
+
+
+def measure(ingest, objects, repeat_until=1.0):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        ingest(objects)
+        count += len(objects)
+        elapsed = time.perf_counter() - start
+        if elapsed >= repeat_until:
+            return count / elapsed
+
+
+def in_process(args, batch_sizes):
+    from app.service.bulk_ingest import BulkIngestor
+
+    def handler(objects, data):
+        pass
+
+    bulk = BulkIngestor(handler, chunk_size=args.chunk_size)
+    pooled = BulkIngestor(handler, chunk_size=args.chunk_size, process_pool_min_items=1, max_processes=args.processes)
+    pooled.ingest(build_objects(args.chunk_size, args.json_bytes))  # Start the processes
+
+    print(f"In process, jsonData of {args.json_bytes} bytes, chunks of {args.chunk_size}, {args.processes} processes")
+    for batch_size in batch_sizes:
+        objects = build_objects(batch_size, args.json_bytes)
+        results = [measure(one_at_a_time, objects), measure(bulk.ingest, objects), measure(pooled.ingest, objects)]
+        print(f"{batch_size:>8} objects: one at a time {results[0]:10.0f}/s  bulk {results[1]:10.0f}/s  "
+              f"bulk + processes {results[2]:10.0f}/s")
+    pooled.close()
+
+
+def over_grpc(args, batch_sizes):
+    import grpc
+    from app.proto.gen import BaseModel1_pb2, BaseModel1_pb2_grpc
+
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_grpc_server", "--serve", "thread",
+                               "--port", str(args.port), "--work-ms", "0"])
+    try:
+        with grpc.insecure_channel(f"localhost:{args.port}") as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+            stub = BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub(channel)
+            print(f"Over gRPC, {args.total} objects")
+            for batch_size in batch_sizes:
+                objects = build_objects(batch_size, args.json_bytes)
+                request = BaseModel1_pb2.ExampleCallReturnsEmptyRequest(listOfObjectExample=objects)
+                batches = max(1, args.total // batch_size)
+
+                start = time.perf_counter()
+                try:
+                    for _ in range(batches):
+                        stub.ExampleCallReturnsEmpty(request)
+                    unary = f"{batches * batch_size / (time.perf_counter() - start):10.0f}/s"
+                except grpc.RpcError as e:
+                    unary = f"{e.code().name:>12}"
+
+                start = time.perf_counter()
+                try:
+                    response = stub.IngestObjectExamples(request for _ in range(batches))
+                    streamed = f"{response.objectsReceived / (time.perf_counter() - start):10.0f}/s"
+                except grpc.RpcError as e:
+                    streamed = f"{e.code().name:>12}"
+                print(f"{batch_size:>8} objects per message: unary {unary}  client stream {streamed}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--json-bytes", type=int, default=200, help="size of each jsonData document")
+    parser.add_argument("--batch-sizes", default="100,1000,10000,100000")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=2)
+    parser.add_argument("--total", type=int, default=200000, help="objects sent over gRPC for each batch size")
+    parser.add_argument("--port", type=int, default=50153)
+    args = parser.parse_args()
+
+    quiet_logging()
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    in_process(args, batch_sizes)
+    over_grpc(args, batch_sizes)
+
+
+if __name__ == "__main__":
+    main()
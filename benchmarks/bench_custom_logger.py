@@ -0,0 +1,81 @@
+# bench_custom_logger.py
+
+# Compares the per-call cost of CustomLogger against the previous implementation, which resolved the
+# caller with inspect.stack() and built the context prefix even for records below the logger's level.
+#
+#   python -m benchmarks.bench_custom_logger --calls 20000
+
+import argparse
+import inspect
+import logging
+import time
+
+from app.utils.custom_logger import CustomLogger
+
+
+class LegacyCustomLogger(CustomLogger):
+    """The previous implementation, kept here as the baseline."""
+
+    def _log_with_stacklevel(self, level, msg, *args, request=None, exc_info=None, **kwargs):
+        msg = self.build_msg(msg, request)
+
+        if exc_info:
+            kwargs['exc_info'] = exc_info
+
+        if 'stacklevel' not in kwargs:
+            frame_info = inspect.stack()
+            stacklevel = 2
+            for i, frame in enumerate(frame_info):
+                if 'custom_logger.py' not in frame.filename:
+                    stacklevel = i + 1
+                    break
+            kwargs['stacklevel'] = stacklevel
+
+        super().log(level, msg, *args, **kwargs)
+
+
+class DiscardHandler(logging.Handler):
+    """Accepts every record without writing it, so the logger's own work is what gets measured."""
+
+    def emit(self, record):
+        pass
+
+
+def build_logger(logger_class, name):
+    bench_logger = logger_class(name)
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    bench_logger.addHandler(DiscardHandler())
+    return bench_logger
+
+
+def nested_call(bench_logger, method, depth, calls):
+    # Log from a few frames deep, like a handler called through FastAPI and the service layer
+    if depth:
+        return nested_call(bench_logger, method, depth - 1, calls)
+    log = getattr(bench_logger, method)
+    start = time.perf_counter()
+    for i in range(calls):
+        log("processed item %s", i)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--depth", type=int, default=20)
+    args = parser.parse_args()
+
+    for method, label in (("debug", "disabled (DEBUG)"), ("info", "enabled (INFO)")):
+        timings = {}
+        for mode, logger_class in (("legacy", LegacyCustomLogger), ("new", CustomLogger)):
+            bench_logger = build_logger(logger_class, f"bench-{mode}")
+            nested_call(bench_logger, method, args.depth, 200)  # Warm up
+            timings[mode] = nested_call(bench_logger, method, args.depth, args.calls)
+        per_call = {mode: seconds / args.calls * 1e6 for mode, seconds in timings.items()}
+        print(f"{label:>18}: legacy {per_call['legacy']:8.2f} us/call  new {per_call['new']:8.2f} us/call  "
+              f"({timings['legacy'] / timings['new']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
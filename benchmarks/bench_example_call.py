@@ -0,0 +1,112 @@
+# bench_example_call.py
+
+# ExampleCall answers per second for a batch job looking up --calls userIds out of --users distinct
+# ones, against the gRPC server in its own process, with and without the response cache. Unary:
+# one call per userId from --concurrency clients. Stream: ExampleCallStream with --stream-batch
+# userIds per call. The lookup behind ExampleCall takes --lookup-ms.
+#
+#   python -m benchmarks.bench_example_call --calls 5000 --users 500 --lookup-ms 2 --concurrency 20 --stream-batch 500
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+from benchmarks._asgi import quiet_logging
+
+
+def run_server(args):
+    from app_instance import app
+
+    quiet_logging()
+    app.state.GRPC_PORT = args.port
+    app.state.GRPC_RESPONSE_CACHE_TTL = args.serve_cache_ttl
+    from app.grpc import base_model1_grpc_impl
+
+    lookup_seconds = args.lookup_ms / 1000
+
+    class SlowLookupServicer(base_model1_grpc_impl.BaseModel1GRPCServiceServicer):
+        def lookup_transactions(self, request):
+            time.sleep(lookup_seconds)
+            return super().lookup_transactions(request)
+
+    class AsyncSlowLookupServicer(base_model1_grpc_impl.AsyncBaseModel1GRPCServiceServicer):
+        async def lookup_transactions(self, request):
+            await asyncio.sleep(lookup_seconds)
+            return await super().lookup_transactions(request)
+
+    if args.server_mode == "thread":
+        base_model1_grpc_impl.serve(SlowLookupServicer())
+    else:
+        async def serve_aio():
+            await base_model1_grpc_impl.start_aio(AsyncSlowLookupServicer())
+            await base_model1_grpc_impl.aio_server.wait_for_termination()
+        asyncio.run(serve_aio())
+
+
+async def unary(stub, user_ids, concurrency, BaseModel1_pb2):
+    remaining = iter(user_ids)
+
+    async def client():
+        for user_id in remaining:
+            response = await stub.ExampleCall(BaseModel1_pb2.ExampleCallRequest(userId=user_id))
+            assert response.userId == user_id
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def streamed(stub, user_ids, batch, BaseModel1_pb2):
+    for start in range(0, len(user_ids), batch):
+        request = BaseModel1_pb2.ExampleCallStreamRequest(userIds=user_ids[start:start + batch])
+        async for _ in stub.ExampleCallStream(request):
+            pass
+
+
+async def load(args, user_ids, mode):
+    import grpc
+    from app.proto.gen import BaseModel1_pb2, BaseModel1_pb2_grpc
+
+    async with grpc.aio.insecure_channel(f"localhost:{args.port}") as channel:
+        await asyncio.wait_for(channel.channel_ready(), 30)
+        stub = BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub(channel)
+        start = time.perf_counter()
+        if mode == "unary":
+            await unary(stub, user_ids, args.concurrency, BaseModel1_pb2)
+        else:
+            await streamed(stub, user_ids, args.stream_batch, BaseModel1_pb2)
+        return len(user_ids) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500, help="distinct userIds among the calls")
+    parser.add_argument("--lookup-ms", type=float, default=2)
+    parser.add_argument("--concurrency", type=int, default=20, help="clients making unary calls")
+    parser.add_argument("--stream-batch", type=int, default=500, help="userIds per ExampleCallStream call")
+    parser.add_argument("--cache-ttl", type=float, default=60)
+    parser.add_argument("--server-mode", choices=("thread", "aio"), default="thread")
+    parser.add_argument("--port", type=int, default=50154)
+    parser.add_argument("--serve-cache-ttl", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_cache_ttl is not None:
+        run_server(args)
+        return
+
+    user_ids = [f"user-{i % args.users}" for i in range(args.calls)]
+    for cache, ttl in (("no cache", 0), ("cached", args.cache_ttl)):
+        for mode in ("unary", "stream"):
+            # A new server for each run, so the cached runs start cold
+            server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_example_call", "--serve-cache-ttl", str(ttl),
+                                       "--server-mode", args.server_mode, "--lookup-ms", str(args.lookup_ms), "--port", str(args.port)])
+            try:
+                answers_per_second = asyncio.run(load(args, user_ids, mode))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{mode:>6}, {cache:>8}: {answers_per_second:9.0f} answers/s  ({args.calls} userIds, {args.users} distinct)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_grpc_channel_pool.py
+
+# ExampleCall throughput and latency against a local BaseModel1GRPCService server (the aio server of
+# bench_grpc_server.py, in its own process): a new channel for every call, as the services built on
+# this base often do, vs stubs from the channel registry, from a thread pool and from grpc.aio tasks.
+#
+#   python -m benchmarks.bench_grpc_channel_pool --requests 5000 --concurrency 50 --channels 4
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks._asgi import quiet_logging
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000 if latencies else 0
+
+
+def report(mode, latencies, elapsed):
+    latencies.sort()
+    print(f"{mode:>16}: {len(latencies) / elapsed:9.1f} req/s  p50 {percentile(latencies, 50):6.2f}ms  "
+          f"p99 {percentile(latencies, 99):6.2f}ms  max {percentile(latencies, 100):6.2f}ms")
+
+
+def run_threads(call, requests, concurrency):
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(pool.map(timed, range(requests)))
+    return latencies, time.perf_counter() - start
+
+
+async def run_tasks(call, requests, concurrency):
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=4, help="channels per target")
+    parser.add_argument("--port", type=int, default=50152)
+    args = parser.parse_args()
+
+    import grpc
+    from app.client.grpc_channel_pool import ChannelRegistry, build_channel_options
+    from app.proto.gen import BaseModel1_pb2, BaseModel1_pb2_grpc
+
+    quiet_logging()
+    target = f"localhost:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_grpc_server", "--serve", "aio",
+                               "--port", str(args.port), "--work-ms", "0"])
+    try:
+        with grpc.insecure_channel(target) as channel:
+            grpc.channel_ready_future(channel).result(timeout=30)
+        request = BaseModel1_pb2.ExampleCallRequest(userId="bench")
+        registry = ChannelRegistry(channels_per_target=args.channels, options=build_channel_options())
+
+        def new_channel_call():
+            with grpc.insecure_channel(target) as channel:
+                BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub(channel).ExampleCall(request)
+
+        def pooled_call():
+            registry.stub(target, BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub).ExampleCall(request)
+
+        async def pooled_aio_call():
+            await registry.aio_stub(target, BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub).ExampleCall(request)
+
+        report("channel per call", *run_threads(new_channel_call, args.requests, args.concurrency))
+        report("pooled sync", *run_threads(pooled_call, args.requests, args.concurrency))
+        report("pooled aio", *asyncio.run(run_tasks(pooled_aio_call, args.requests, args.concurrency)))
+        for target_name, metrics in registry.metrics().items():
+            print(f"{target_name}: {metrics['calls']} calls, {metrics['errors']} errors, "
+                  f"avg {metrics['latency_avg'] * 1000:.2f}ms, p99 {metrics['latency_p99'] * 1000:.2f}ms")
+        registry.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bench_grpc_server.py
+
+# ghz style load test of the gRPC server: for each mode the server runs in its own process with the
+# grpc config (thread: pool of --max-workers threads, aio: grpc.aio server on an event loop) and
+# --concurrency clients call ExampleCall --requests times. Reports requests per second, latency
+# percentiles and rejected RPCs. --work-ms adds simulated I/O to the handler (time.sleep on the
+# thread pool, asyncio.sleep on the event loop), which is where the 10 thread cap shows.
+#
+#   python -m benchmarks.bench_grpc_server --requests 5000 --concurrency 100 --work-ms 20
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+from benchmarks._asgi import quiet_logging
+
+
+def run_server(mode, port, work_ms):
+    import grpc
+    from app_instance import app
+    from app.grpc import base_model1_grpc_impl
+
+    quiet_logging()
+    app.state.GRPC_PORT = port
+    work_seconds = work_ms / 1000
+
+    class SlowServicer(base_model1_grpc_impl.BaseModel1GRPCServiceServicer):
+        def ExampleCall(self, request, context):
+            time.sleep(work_seconds)
+            return super().ExampleCall(request, context)
+
+    class AsyncSlowServicer(base_model1_grpc_impl.AsyncBaseModel1GRPCServiceServicer):
+        async def ExampleCall(self, request, context):
+            await asyncio.sleep(work_seconds)
+            return await super().ExampleCall(request, context)
+
+    if mode == "thread":
+        base_model1_grpc_impl.serve(SlowServicer())
+    else:
+        async def serve_aio():
+            await base_model1_grpc_impl.start_aio(AsyncSlowServicer())
+            await base_model1_grpc_impl.aio_server.wait_for_termination()
+        asyncio.run(serve_aio())
+
+
+async def load(port, requests, concurrency):
+    import grpc
+    from app.proto.gen import BaseModel1_pb2, BaseModel1_pb2_grpc
+
+    latencies = []
+    errors = {}
+    remaining = iter(range(requests))
+    async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+        await asyncio.wait_for(channel.channel_ready(), 30)
+        stub = BaseModel1_pb2_grpc.BaseModel1GRPCServiceStub(channel)
+        request = BaseModel1_pb2.ExampleCallRequest(userId="bench")
+
+        async def client():
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    await stub.ExampleCall(request)
+                    latencies.append(time.perf_counter() - start)
+                except grpc.aio.AioRpcError as e:
+                    errors[e.code().name] = errors.get(e.code().name, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return sorted(latencies), errors, elapsed
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000 if latencies else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--work-ms", type=float, default=20, help="simulated I/O per RPC")
+    parser.add_argument("--port", type=int, default=50151)
+    parser.add_argument("--modes", default="thread,aio")
+    parser.add_argument("--serve", choices=("thread", "aio"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.serve, args.port, args.work_ms)
+        return
+
+    for mode in args.modes.split(","):
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_grpc_server", "--serve", mode,
+                                   "--port", str(args.port), "--work-ms", str(args.work_ms)])
+        try:
+            latencies, errors, elapsed = asyncio.run(load(args.port, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:>6}: {len(latencies) / elapsed:9.1f} req/s  p50 {percentile(latencies, 50):7.1f}ms  "
+              f"p90 {percentile(latencies, 90):7.1f}ms  p99 {percentile(latencies, 99):7.1f}ms  "
+              f"max {percentile(latencies, 100):7.1f}ms  errors {errors or 0}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# bench_http_client.py
+
+# Latency of calls to a local stub upstream: urlopen in a thread (what auth_service did), a new
+# httpx.AsyncClient per call, and the shared http_client, with distinct URLs and with identical
+# concurrent GETs (coalesced). The stub sleeps --handshake-ms on every new connection, standing in
+# for the TCP and TLS handshake round trips, and --latency-ms on every request. It runs in its own
+# process, so it doesn't compete with the clients for the GIL. Each mode first sends --warmup requests,
+# which aren't measured: the shared client's connections are open by then, so the percentiles are those
+# of its steady state rather than of the handshakes of its first requests.
+#
+#   python -m benchmarks.bench_http_client --requests 1000 --warmup 100 --concurrency 10 --handshake-ms 30 --latency-ms 5
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+from benchmarks._asgi import quiet_logging
+
+
+def run_stub_server(port, handshake_ms, latency_ms):
+    counters = {"connections": 0, "requests": 0}
+    lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive
+        # Headers and body are separate writes, Nagle's algorithm would hold the body back on reused connections
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            with lock:
+                counters["connections"] += 1
+            time.sleep(handshake_ms / 1000)
+            super().setup()
+
+        def do_GET(self):
+            if self.path == "/counters":
+                # Read and reset by the benchmark after each mode
+                with lock:
+                    body = json.dumps(counters).encode()
+                    counters.update(connections=0, requests=0)
+            else:
+                with lock:
+                    counters["requests"] += 1
+                time.sleep(latency_ms / 1000)
+                body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def read_counters(base_url):
+    with urlopen(f"{base_url}/counters", timeout=10) as response:
+        return json.loads(response.read())
+
+
+async def run(call, requests, concurrency):
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for i in remaining:
+            start = time.perf_counter()
+            await call(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return sorted(latencies), time.perf_counter() - start
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100, help="requests sent before measuring each mode")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, default=30, help="delay on every new connection")
+    parser.add_argument("--latency-ms", type=float, default=5, help="delay on every request")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_stub_server(args.port, args.handshake_ms, args.latency_ms)
+        return
+
+    import httpx
+    from app.client.http_client import HttpClient
+
+    quiet_logging()
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_http_client", "--serve", "--port", str(args.port),
+                               "--handshake-ms", str(args.handshake_ms), "--latency-ms", str(args.latency_ms)])
+
+    async def urlopen_call(i):
+        def fetch():
+            with urlopen(f"{base_url}/item/{i}", timeout=10) as response:
+                return response.read()
+        await asyncio.to_thread(fetch)
+
+    async def client_per_call(i):
+        async with httpx.AsyncClient() as client:
+            await client.get(f"{base_url}/item/{i}")
+
+    shared = HttpClient(max_keepalive_connections=args.concurrency, max_concurrency_per_host=args.concurrency)
+
+    async def shared_call(i):
+        await shared.get(f"{base_url}/item/{i}")
+
+    async def coalesced_call(i):
+        await shared.get(f"{base_url}/item/{i // args.concurrency}")
+
+    async def run_all():
+        for mode, call in (("urlopen", urlopen_call), ("client per call", client_per_call),
+                           ("shared", shared_call), ("shared, same GETs", coalesced_call)):
+            await run(call, args.warmup, args.concurrency)
+            await asyncio.to_thread(read_counters, base_url)
+            latencies, elapsed = await run(call, args.requests, args.concurrency)
+            # Less the connection reading the counters
+            counters = await asyncio.to_thread(read_counters, base_url)
+            print(f"{mode:>17}: {len(latencies) / elapsed:8.1f} req/s  p50 {percentile(latencies, 50):7.1f}ms  "
+                  f"p99 {percentile(latencies, 99):7.1f}ms  {counters['connections'] - 1:5d} connections  "
+                  f"{counters['requests']:5d} upstream requests")
+        await shared.close()
+
+    try:
+        for _ in range(50):
+            try:
+                read_counters(base_url)
+                break
+            except OSError:
+                time.sleep(0.1)
+        asyncio.run(run_all())
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
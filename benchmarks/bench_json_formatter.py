@@ -0,0 +1,55 @@
+# bench_json_formatter.py
+
+# Records per second of JsonFormatter and FastJsonFormatter, after checking that both produce the
+# same output for plain, non-ASCII, exception and access-log records.
+#
+#   python -m benchmarks.bench_json_formatter --records 200000
+
+import argparse
+import logging
+import time
+
+
+def make_records():
+    records = []
+    plain = logging.LogRecord("app", logging.INFO, "/app/controller/controller.py", 42, "Request ID: %s - user %s", ("5f0c", "user-1"), None)
+    records.append(plain)
+    records.append(logging.LogRecord("app", logging.WARNING, "/app/utils/api_utils.py", 7, 'Quotes " and unicode é✓ \\ \t', None, None))
+    try:
+        raise ValueError("This is a test exception")
+    except ValueError:
+        import sys
+        error = logging.LogRecord("app", logging.ERROR, "/app/controller/controller.py", 99, "An error occurred", None, sys.exc_info())
+    records.append(error)
+    access = logging.LogRecord("uvicorn.access", logging.INFO, "/h11_impl.py", 476, "access", None, None)
+    access.client_ip, access.request_line, access.status_code, access.response_length = "127.0.0.1", "GET /api/v2/public HTTP/1.1", 200, 512
+    records.append(access)
+    return records
+
+
+def records_per_second(formatter, records, total):
+    start = time.perf_counter()
+    for index in range(total):
+        formatter.format(records[index % len(records)])
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    from logging_config import FastJsonFormatter, JsonFormatter
+
+    records = make_records()
+    for record in records:
+        assert JsonFormatter().format(record) == FastJsonFormatter().format(record), record.msg
+
+    for label, subset in (("plain", records[:1]), ("exception", records[2:3]), ("mixed", records)):
+        current = records_per_second(JsonFormatter(), subset, args.records)
+        fast = records_per_second(FastJsonFormatter(), subset, args.records)
+        print(f"{label:>10}: JsonFormatter {current:10.0f} records/s  FastJsonFormatter {fast:10.0f} records/s ({fast / current:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_message_decoding.py
+
+# Decoding time and peak memory per Pub/Sub message at 1 KB, 10 KB and 100 KB payloads: the previous
+# json.loads + key lookups of consume_message, MessageDecoder on JSON with the standard library and
+# with orjson, and MessageDecoder on the protobuf encoding of the same message.
+#
+#   python -m benchmarks.bench_message_decoding --messages 2000
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from app.proto.gen import BaseModel1_pb2
+from app.pubsub.message_decoder import tracked_message_decoder
+from app.utils import json_codec
+
+
+class BenchMessage:
+    """Stands in for a pubsub_v1 Message, only data and attributes are read."""
+
+    def __init__(self, data, attributes):
+        self.data = data
+        self.attributes = attributes
+
+
+# Field number 100, length-delimited
+UNKNOWN_FIELD_TAG = bytes([0xa2, 0x06])
+
+
+def encode_varint(value):
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def build_payloads(size):
+    ids = {"user_id": "user-1", "request_id": "request-1", "session_id": "session-1", "query_id": "query-1"}
+    item = {"userId": "user-1", "reportId": "report-1", "transactionId": "transaction-1",
+            "jsonData": '{"amount": 125.5, "currency": "USD"}', "transactionDate": "2024-06-01T12:00:00"}
+    items = []
+    while len(json.dumps({**ids, "items": items})) < size:
+        items.append(dict(item, transactionId=f"transaction-{len(items)}"))
+    json_payload = json.dumps({**ids, "items": items}).encode("utf-8")
+    # The items are padding the decoder skips in both encodings: an extra key of the JSON object, and
+    # in protobuf a field unknown to TrackedMessage, like one added by a publisher on a newer schema
+    proto_payload = BaseModel1_pb2.TrackedMessage(**ids).SerializeToString()
+    for item in items:
+        encoded = BaseModel1_pb2.ObjectExample(**item).SerializeToString()
+        proto_payload += UNKNOWN_FIELD_TAG + encode_varint(len(encoded)) + encoded
+    return json_payload, proto_payload
+
+
+def legacy_decode(message):
+    data = json.loads(message.data.decode('utf-8'))
+    return data["user_id"], data["request_id"], data["session_id"], data["query_id"]
+
+
+def measure(decode, message, count):
+    decode(message)  # Warm up
+    start = time.perf_counter()
+    for _ in range(count):
+        decode(message)
+    per_message = (time.perf_counter() - start) / count
+    tracemalloc.start()
+    decode(message)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_message, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    for size in (1024, 10 * 1024, 100 * 1024):
+        json_payload, proto_payload = build_payloads(size)
+        json_message = BenchMessage(json_payload, {})
+        proto_message = BenchMessage(proto_payload, {"encoding": "protobuf"})
+        count = max(20, args.messages * 1024 // size)
+        print(f"{len(json_payload)} bytes JSON / {len(proto_payload)} bytes protobuf, {count} messages")
+        results = []
+        for mode, backend, decode, message in (("legacy json.loads", None, legacy_decode, json_message),
+                                                ("decoder, json", "json", tracked_message_decoder.decode, json_message),
+                                                ("decoder, orjson", "orjson", tracked_message_decoder.decode, json_message),
+                                                ("decoder, protobuf", None, tracked_message_decoder.decode, proto_message)):
+            if backend:
+                json_codec.set_backend(backend)
+                if json_codec.backend != backend:
+                    print(f"{mode:>20}: skipped, {backend} isn't installed")
+                    continue
+            per_message, peak = measure(decode, message, count)
+            results.append(per_message)
+            print(f"{mode:>20}: {per_message * 1e6:10.1f} us/msg  peak {peak / 1024:8.1f} KiB  ({results[0] / per_message:.1f}x)")
+        json_codec.set_backend("orjson")
+
+
+if __name__ == "__main__":
+    main()
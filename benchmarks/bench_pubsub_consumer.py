@@ -0,0 +1,129 @@
+# bench_pubsub_consumer.py
+
+# Load test of the Pub/Sub consumer against the emulator: publishes messages to a new topic, consumes
+# them through start_subscriber() with the given consumer settings, and reports messages per second
+# and how many messages were delivered more than once. With --batch-max-items the messages go through
+# a BatchingConsumer, and the simulated processing time is spent once per batch, like a bulk write.
+# With --mode asyncio the messages are dispatched as asyncio tasks that await the simulated I/O.
+#
+#   gcloud beta emulators pubsub start --host-port=localhost:8085
+#   PUBSUB_EMULATOR_HOST=localhost:8085 python -m benchmarks.bench_pubsub_consumer --messages 2000 --work-ms 20
+#   PUBSUB_EMULATOR_HOST=localhost:8085 python -m benchmarks.bench_pubsub_consumer --messages 2000 --work-ms 20 --batch-max-items 50 --max-messages 100
+#   PUBSUB_EMULATOR_HOST=localhost:8085 python -m benchmarks.bench_pubsub_consumer --messages 20000 --work-ms 20 --mode asyncio --max-messages 1000
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from uuid import uuid4
+
+from benchmarks._asgi import quiet_logging
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--work-ms", type=float, default=20, help="simulated processing time per message")
+    parser.add_argument("--max-workers", type=int, default=2)
+    parser.add_argument("--max-workers-limit", type=int, default=2, help="above --max-workers enables adaptive tuning")
+    parser.add_argument("--target-latency-ms", type=float, default=100)
+    parser.add_argument("--tuning-interval", type=float, default=2)
+    parser.add_argument("--max-messages", type=int, default=10, help="flow control, messages leased at once")
+    parser.add_argument("--ack-deadline", type=int, default=10, help="ack deadline of the subscription in seconds")
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--max-concurrency", type=int, default=1000, help="tasks at once in the asyncio mode")
+    parser.add_argument("--batch-max-items", type=int, default=0)
+    parser.add_argument("--batch-max-latency-ms", type=float, default=50)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    if not os.getenv("PUBSUB_EMULATOR_HOST"):
+        sys.exit("Set PUBSUB_EMULATOR_HOST to the address of a running Pub/Sub emulator")
+
+    from google.cloud import pubsub_v1
+    from app_instance import app
+    from app.pubsub import gcp_pub_sub_consumer
+    from app.pubsub.batching_consumer import BatchingConsumer
+
+    quiet_logging()
+    run_id = uuid4().hex[:8]
+    app.state.PUBSUB_TOPIC_ID = f"bench-consumer-{run_id}"
+    app.state.PUBSUB_SUBSCRIPTION_ID = f"bench-consumer-{run_id}-sub"
+    app.state.PUBSUB_CONSUMER_MAX_WORKERS = args.max_workers
+    app.state.PUBSUB_CONSUMER_MAX_WORKERS_LIMIT = args.max_workers_limit
+    app.state.PUBSUB_CONSUMER_TARGET_LATENCY_MS = args.target_latency_ms
+    app.state.PUBSUB_CONSUMER_TUNING_INTERVAL = args.tuning_interval
+    app.state.PUBSUB_CONSUMER_MAX_MESSAGES = args.max_messages
+    app.state.PUBSUB_CONSUMER_MODE = args.mode
+    app.state.PUBSUB_CONSUMER_MAX_CONCURRENCY = args.max_concurrency
+
+    publisher = pubsub_v1.PublisherClient()
+    subscriber = pubsub_v1.SubscriberClient()
+    topic_path = publisher.topic_path(app.state.APP_PROJECT_ID, app.state.PUBSUB_TOPIC_ID)
+    subscription_path = subscriber.subscription_path(app.state.APP_PROJECT_ID, app.state.PUBSUB_SUBSCRIPTION_ID)
+    # The subscription has to exist before publishing, or the emulator drops the messages
+    publisher.create_topic(name=topic_path)
+    subscriber.create_subscription(name=subscription_path, topic=topic_path, ack_deadline_seconds=args.ack_deadline)
+
+    futures = [publisher.publish(topic_path, b'{}', seq=str(i)) for i in range(args.messages)]
+    for future in futures:
+        future.result()
+    print(f"Published {args.messages} messages to {topic_path}")
+
+    deliveries = Counter()
+    lock = threading.Lock()
+    all_acked = threading.Event()
+    work_seconds = args.work_ms / 1000
+
+    def record(messages):
+        with lock:
+            for message in messages:
+                deliveries[message.attributes["seq"]] += 1
+            if len(deliveries) == args.messages:
+                all_acked.set()
+
+    def callback(message):
+        time.sleep(work_seconds)
+        message.ack()
+        record([message])
+
+    async def async_callback(message):
+        await asyncio.sleep(work_seconds)
+        message.ack()
+        record([message])
+
+    def batch_handler(messages):
+        time.sleep(work_seconds)
+        record(messages)
+
+    if args.batch_max_items:
+        callback = BatchingConsumer(batch_handler, max_items=args.batch_max_items, max_latency_ms=args.batch_max_latency_ms)
+    elif args.mode == "asyncio":
+        callback = async_callback
+
+    start = time.perf_counter()
+    subscriber_thread = threading.Thread(target=gcp_pub_sub_consumer.start_subscriber, args=(callback,), daemon=True)
+    subscriber_thread.start()
+    finished = all_acked.wait(args.timeout)
+    elapsed = time.perf_counter() - start
+    metrics = gcp_pub_sub_consumer.executor.metrics()
+    gcp_pub_sub_consumer.stop_subscriber(timeout=5)
+
+    subscriber.delete_subscription(subscription=subscription_path)
+    publisher.delete_topic(topic=topic_path)
+
+    unique = len(deliveries)
+    redelivered = sum(count - 1 for count in deliveries.values())
+    if not finished:
+        print(f"Timed out after {args.timeout:.0f}s with {unique}/{args.messages} messages acked")
+    print(f"{unique / elapsed:10.1f} msgs/s  ({unique} messages in {elapsed:.1f}s)")
+    print(f"{redelivered:10d} redeliveries  ({redelivered / unique if unique else 0:.1%} of messages)")
+    print(f"{metrics['max_workers']:10d} workers at the end, average wait {metrics['wait_time_avg'] * 1000:.1f}ms, "
+          f"average run {metrics['run_time_avg'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
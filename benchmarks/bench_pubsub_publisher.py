@@ -0,0 +1,72 @@
+# bench_pubsub_publisher.py
+
+# Publishing throughput against the Pub/Sub emulator: the previous template (future.result() on the
+# event loop for every message), awaiting each publish in turn, concurrent publishes, and publish_many.
+#
+#   gcloud beta emulators pubsub start --host-port=localhost:8085
+#   PUBSUB_EMULATOR_HOST=localhost:8085 python -m benchmarks.bench_pubsub_publisher --messages 5000 --size 512
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from uuid import uuid4
+
+from benchmarks._asgi import quiet_logging
+
+
+async def blocking(publisher, payloads):
+    # The previous template: the event loop waits for every acknowledgement
+    for payload in payloads:
+        publisher.client.publish(publisher.topic_path, payload).result()
+
+
+async def awaited(publisher, payloads):
+    for payload in payloads:
+        await publisher.publish(payload)
+
+
+async def concurrent(publisher, payloads):
+    await asyncio.gather(*(publisher.publish(payload) for payload in payloads))
+
+
+async def bulk(publisher, payloads):
+    await publisher.publish_many(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=512, help="message size in bytes")
+    parser.add_argument("--sequential-messages", type=int, default=500,
+                        help="messages for the modes that wait for each acknowledgement, which are much slower")
+    args = parser.parse_args()
+
+    if not os.getenv("PUBSUB_EMULATOR_HOST"):
+        sys.exit("Set PUBSUB_EMULATOR_HOST to the address of a running Pub/Sub emulator")
+
+    from app_instance import app
+    from app.pubsub.gcp_pubsub_producer import Publisher
+
+    quiet_logging()
+    publisher = Publisher(app.state.PUBSUB_PROJECT_ID, f"bench-publisher-{uuid4().hex[:8]}")
+    publisher.client.create_topic(name=publisher.topic_path)
+    payload = os.urandom(args.size)
+
+    for mode, publish, count in (("blocking", blocking, args.sequential_messages),
+                                 ("awaited", awaited, args.sequential_messages),
+                                 ("concurrent", concurrent, args.messages),
+                                 ("publish_many", bulk, args.messages)):
+        payloads = [payload] * count
+        start = time.perf_counter()
+        asyncio.run(publish(publisher, payloads))
+        elapsed = time.perf_counter() - start
+        print(f"{mode:>12}: {count / elapsed:10.1f} msgs/s  ({count} messages of {args.size} bytes in {elapsed:.2f}s)")
+
+    publisher.client.delete_topic(topic=publisher.topic_path)
+    publisher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_request_middleware.py
+
+# Compares requests per second through the pure ASGI RequestStateMiddleware against the previous
+# BaseHTTPMiddleware implementation, on a cheap endpoint so the middleware cost dominates.
+#
+#   python -m benchmarks.bench_request_middleware --requests 5000
+
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from benchmarks._asgi import asgi_get, build_app, quiet_logging
+
+
+class LegacyRequestStateMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, kept here as the baseline."""
+
+    async def dispatch(self, request, call_next):
+        request_id = (
+                request.headers.get("request_id")
+                or request.headers.get("requestId")
+                or request.query_params.get("request_id")
+                or request.query_params.get("requestId")
+        )
+        request.state.request_id = request_id if request_id else str(uuid4())
+        session_id = (
+                request.headers.get("session_id")
+                or request.headers.get("sessionId")
+                or request.query_params.get("session_id")
+                or request.query_params.get("sessionId")
+        )
+        request.state.session_id = session_id if session_id else str(uuid4())
+        user_id = (
+                request.headers.get("user_id")
+                or request.headers.get("userId")
+                or request.query_params.get("user_id")
+                or request.query_params.get("userId")
+        )
+        request.state.user_id = user_id if user_id else ''
+        request.state.query = request.query_params.get("query", '')
+        agent_endpoints = ["/agent", "/agentexp", "/agentexpflash", "/agentexpgpt35turbo", "/agentexpgpt4omini", "/agentexpgpt4o", "/templates"]
+        request_path = request.url.path
+        request.state.agent = ''
+        for endpoint in agent_endpoints:
+            if request_path.startswith(endpoint):
+                request.state.agent = endpoint.lstrip('/')
+                request.state.query_id = str(uuid4())
+                break
+        return await call_next(request)
+
+
+async def run(app, total):
+    headers = {"sessionId": "session-1", "user-agent": "bench", "accept": "*/*", "host": "localhost"}
+    start = time.perf_counter()
+    for _ in range(total):
+        status, _, _ = await asgi_get(app, "/api/v2/", headers=headers, query_string="userId=user-1&query=q")
+        assert status == 200, status
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    from app.utils.api_utils import RequestStateMiddleware
+
+    quiet_logging()
+    for mode, middleware_class in (("legacy", LegacyRequestStateMiddleware), ("asgi", RequestStateMiddleware)):
+        app = build_app(middleware_class)
+        asyncio.run(run(app, 200))  # Warm up
+        rps = asyncio.run(run(app, args.requests))
+        print(f"{mode:>8}: {rps:10.1f} req/s  ({args.requests} requests)")
+
+
+if __name__ == "__main__":
+    main()
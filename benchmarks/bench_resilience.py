@@ -0,0 +1,97 @@
+# bench_resilience.py
+
+# What a degrading dependency costs its callers, with and without a resilience policy. Calls arrive
+# at a fixed --rate, whatever the dependency's latency, like requests to the service. The simulated
+# dependency answers in --healthy-ms, then for the middle third of the run in --degraded-ms (or
+# times out after --timeout-ms with --failing). Reports, for the calls started while it was degraded,
+# the latency percentiles and how many failed fast, and the most calls in flight at once: the
+# threads, sockets and memory the slow dependency holds.
+#
+#   python -m benchmarks.bench_resilience --rate 500 --duration 6 --healthy-ms 10 --degraded-ms 2000 --latency-target-ms 100
+#   python -m benchmarks.bench_resilience --rate 500 --duration 6 --failing
+
+import argparse
+import asyncio
+import time
+
+from benchmarks._asgi import quiet_logging
+
+
+async def run(call, rate, duration):
+    results = []
+    in_flight = peak_in_flight = 0
+
+    async def timed_call():
+        nonlocal in_flight, peak_in_flight
+        start = time.perf_counter()
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        failed = False
+        try:
+            await call()
+        except Exception:
+            failed = True
+        in_flight -= 1
+        results.append((start, time.perf_counter() - start, failed))
+
+    tasks = []
+    run_start = time.perf_counter()
+    for i in range(int(rate * duration)):
+        await asyncio.sleep(max(0.0, run_start + i / rate - time.perf_counter()))
+        tasks.append(asyncio.create_task(timed_call()))
+    await asyncio.gather(*tasks)
+    return run_start, results, peak_in_flight
+
+
+def percentile(latencies, p):
+    return latencies[min(len(latencies) - 1, len(latencies) * p // 100)] * 1000 if latencies else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=500, help="calls per second")
+    parser.add_argument("--duration", type=float, default=6)
+    parser.add_argument("--healthy-ms", type=float, default=10)
+    parser.add_argument("--degraded-ms", type=float, default=2000)
+    parser.add_argument("--timeout-ms", type=float, default=1000, help="timeout of a call with --failing")
+    parser.add_argument("--failing", action="store_true", help="degraded calls time out instead of answering slowly")
+    parser.add_argument("--latency-target-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    from app.utils.resilience import AdaptiveLimiter, CircuitBreaker, ResiliencePolicy
+
+    quiet_logging()
+    degraded_from, degraded_to = args.duration / 3, 2 * args.duration / 3
+
+    for mode in ("unprotected", "resilient"):
+        start = time.perf_counter()
+
+        async def dependency():
+            degraded = degraded_from <= time.perf_counter() - start < degraded_to
+            if not degraded:
+                await asyncio.sleep(args.healthy_ms / 1000)
+            elif args.failing:
+                await asyncio.sleep(args.timeout_ms / 1000)
+                raise TimeoutError()
+            else:
+                await asyncio.sleep(args.degraded_ms / 1000)
+
+        call = dependency
+        if mode == "resilient":
+            policy = ResiliencePolicy("bench", CircuitBreaker(failure_threshold=5, reset_timeout=0.5),
+                                      AdaptiveLimiter(initial_limit=50, latency_target=args.latency_target_ms / 1000))
+
+            async def call():
+                await policy.acall(dependency)
+
+        run_start, results, peak_in_flight = asyncio.run(run(call, args.rate, args.duration))
+        degraded = [(latency, failed) for started, latency, failed in results
+                    if degraded_from <= started - run_start < degraded_to]
+        latencies = sorted(latency for latency, _ in degraded)
+        failed = sum(failed for _, failed in degraded)
+        print(f"{mode:>12}: while degraded {len(degraded):5d} calls, {failed:5d} failed, p50 {percentile(latencies, 50):7.1f}ms  "
+              f"p99 {percentile(latencies, 99):7.1f}ms  |  peak in flight {peak_in_flight:5d}")
+
+
+if __name__ == "__main__":
+    main()
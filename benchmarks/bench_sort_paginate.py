@@ -0,0 +1,88 @@
+# bench_sort_paginate.py
+
+# Compares sorting() followed by pagination() against sort_and_paginate() for a few pages at
+# 10k, 100k and 1M report entries, from a list and from a generator. Then walks through the first
+# --walk-pages pages of each list, re-sorting for every page vs reusing the cached sort order.
+#
+#   python -m benchmarks.bench_sort_paginate --sizes 10000 100000 1000000
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from benchmarks._asgi import quiet_logging
+
+
+def make_request(**query_params):
+    return SimpleNamespace(query_params={key: str(value) for key, value in query_params.items()}, state=SimpleNamespace())
+
+
+def make_reports(count):
+    rng = random.Random(42)
+    return [{"report_id": f"report-{index}", "created_at": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T{rng.random():.6f}"}
+            for index in range(count)]
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--walk-pages", type=int, default=50)
+    args = parser.parse_args()
+
+    from app.utils.api_utils import pagination, sort_and_paginate, sort_index_cache, sorting
+
+    quiet_logging()
+    for size in args.sizes:
+        reports = make_reports(size)
+        for page in args.pages:
+            params = {"sort_by": "created_at", "sort_order": "desc", "page": page, "page_size": args.page_size}
+
+            def current():
+                request = make_request(**params)
+                return pagination(sorting(reports, request), request)
+
+            def combined():
+                return sort_and_paginate(reports, make_request(**params))
+
+            def combined_generator():
+                return sort_and_paginate((report for report in reports), make_request(**params))
+
+            assert current() == combined() == combined_generator()
+            baseline = best_of(args.repeat, current)
+            heap = best_of(args.repeat, combined)
+            generator = best_of(args.repeat, combined_generator)
+            print(f"{size:>8} entries, page {page:>3}: sorting+pagination {baseline * 1000:8.1f} ms  "
+                  f"sort_and_paginate {heap * 1000:8.1f} ms ({baseline / heap:4.1f}x)  from generator {generator * 1000:8.1f} ms")
+
+
+        def walk_current():
+            for page in range(1, args.walk_pages + 1):
+                request = make_request(sort_by="created_at", page=page, page_size=args.page_size)
+                pagination(sorting(reports, request), request)
+
+        def walk_cached():
+            sort_index_cache.invalidate("benchmark-v1")
+            for page in range(1, args.walk_pages + 1):
+                sort_and_paginate(reports, make_request(sort_by="created_at", page=page, page_size=args.page_size), dataset_version="benchmark-v1")
+
+        baseline = best_of(1, walk_current)
+        cached = best_of(1, walk_cached)
+        print(f"{size:>8} entries, pages 1..{args.walk_pages}: sorting+pagination {baseline * 1000:8.1f} ms  "
+              f"cached sort order {cached * 1000:8.1f} ms ({baseline / cached:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# bench_streaming_response.py
+
+# Compares time to first byte and peak RSS of create_api_response, which materializes the whole
+# result, against create_streaming_api_response. Each mode runs in its own process so the peak
+# RSS of one does not hide the other.
+#
+#   python -m benchmarks.bench_streaming_response --entries 200000
+
+import argparse
+import asyncio
+import datetime
+import resource
+import subprocess
+import sys
+import time
+
+from fastapi import FastAPI, Request
+
+from benchmarks._asgi import asgi_get, quiet_logging
+
+
+def generate_reports(count):
+    created_at = datetime.datetime(2024, 1, 1)
+    for index in range(count):
+        yield {
+            "report_id": f"report-{index}",
+            "user_id": "user-1",
+            "title": f"Quarterly report {index}",
+            "created_at": created_at + datetime.timedelta(minutes=index),
+            "score": index * 0.5,
+            "tags": ["finance", "quarterly"],
+        }
+
+
+def build_app(mode, entries, chunk_size):
+    from app.utils.api_utils import RequestStateMiddleware, create_api_response, create_streaming_api_response
+
+    app = FastAPI()
+    app.add_middleware(RequestStateMiddleware)
+
+    @app.get("/reports")
+    async def reports(request: Request):
+        if mode == "streaming":
+            return create_streaming_api_response(generate_reports(entries), request, chunk_size=chunk_size)
+        return create_api_response(list(generate_reports(entries)), request)
+
+    return app
+
+
+def run_mode(mode, entries, chunk_size):
+    quiet_logging()
+    app = build_app(mode, entries, chunk_size)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    status, length, first_byte = asyncio.run(asgi_get(app, "/reports", collect_body=False))
+    total = time.perf_counter() - start
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    assert status == 200, status
+    print(f"{mode:>10}: TTFB {first_byte * 1000:9.1f} ms  total {total * 1000:9.1f} ms  "
+          f"peak RSS growth {rss_growth / 1024:8.1f} MiB  ({entries} entries, {length / 1024 / 1024:.1f} MiB body)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--mode", choices=["buffered", "streaming"])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.entries, args.chunk_size)
+        return
+
+    for mode in ("buffered", "streaming"):
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_streaming_response", "--mode", mode,
+                        "--entries", str(args.entries), "--chunk-size", str(args.chunk_size)], check=True)
+
+
+if __name__ == "__main__":
+    main()
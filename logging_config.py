@@ -1,12 +1,18 @@
 # logging_config.py
 
+import atexit
+import copy
 import logging
 import os
+import queue
 import sys
+import threading
+from logging.handlers import QueueHandler
 from uvicorn.config import LOGGING_CONFIG
 import json
 import time
 import traceback
+from json.encoder import encode_basestring_ascii
 
 
 class HumanReadableFormatter(logging.Formatter):
@@ -94,10 +100,229 @@ class JsonFormatter(logging.Formatter):
         return json.dumps(log_record)
 
 
+class FastJsonFormatter(JsonFormatter):
+    """Produces exactly the same output as JsonFormatter, at a higher throughput.
 
-def setup_logging_gcp(min_log_level):
-    # Define the  JSON formatter for GCP
-    formatter = JsonFormatter()
+    Records are written into a precompiled template, with strings escaped by the same C escaper json.dumps
+    uses (a compact encoder like orjson would change the bytes GCP receives). The date and time part of the
+    timestamp is reused for every record within the same second, and the stack trace of an exception is
+    rendered once however many times it is logged from the same place.
+    """
+    exception_cache_size = 64
+    _encoder = json.JSONEncoder()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._time_cache = (None, None, None, None)
+        self._exception_cache = {}
+        self._exception_cache_lock = threading.Lock()
+
+    def formatTime(self, record, datefmt=None):
+        if datefmt:
+            return super().formatTime(record, datefmt)
+        # (second, msecs, timestamp, date and time part of the timestamp) of the last record
+        second = int(record.created)
+        cached_second, cached_msecs, cached_text, prefix = self._time_cache
+        if second == cached_second:
+            if record.msecs == cached_msecs:
+                return cached_text
+        else:
+            prefix = time.strftime(self.default_time_format, self.converter(record.created))
+        text = self.default_msec_format % (prefix, record.msecs)
+        self._time_cache = (second, record.msecs, text, prefix)
+        return text
+
+    def encode_value(self, value):
+        # json.dumps writes ints with int.__repr__, so the common types skip the generic encoder
+        value_type = type(value)
+        if value_type is int:
+            return int.__repr__(value)
+        if value_type is str:
+            return encode_basestring_ascii(value)
+        return self._encoder.encode(value)
+
+    def format_exception(self, exc_info):
+        exc_type, exc_value, exc_traceback = exc_info
+        value_text = f"{str(exc_value)}"
+        # Keyed by what the text is made of: the code, line and instruction of each frame of the traceback, which
+        # grows each time the exception is re-raised further up. Code objects don't hold on to the frames and their
+        # locals the way the exception and its traceback would
+        frames = []
+        tb = exc_traceback
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code, tb.tb_lineno, tb.tb_lasti))
+            tb = tb.tb_next
+        key = (exc_type, value_text, tuple(frames))
+        exception_text = self._exception_cache.get(key)
+        if exception_text is not None:
+            return exception_text
+        exception_text = ''.join(traceback.format_tb(exc_traceback)) + f"{exc_type.__name__}: " + value_text
+        with self._exception_cache_lock:
+            if len(self._exception_cache) >= self.exception_cache_size:
+                self._exception_cache.clear()
+            self._exception_cache[key] = exception_text
+        return exception_text
+
+    def format(self, record):
+        record.message = record.getMessage()
+        parts = [
+            '{"time": ', encode_basestring_ascii(self.formatTime(record, self.datefmt)),
+            ', "level": ', encode_basestring_ascii(record.levelname),
+            ', "message": ', encode_basestring_ascii(f"[{record.filename}:{record.lineno}] {record.message}"),
+            ', "filename": ', encode_basestring_ascii(record.filename),
+            ', "lineno": ', self.encode_value(record.lineno),
+            ', "process": ', self.encode_value(record.process),
+        ]
+        if record.exc_info:
+            parts += [', "stack_trace": ', encode_basestring_ascii(f"\nStack trace:\n{self.format_exception(record.exc_info)}")]
+        if 'request_line' in record.__dict__:
+            parts += [
+                ', "client_ip": ', self.encode_value(record.client_ip),
+                ', "request_line": ', self.encode_value(record.request_line),
+                ', "status_code": ', self.encode_value(record.status_code),
+                ', "response_length": ', self.encode_value(record.response_length),
+            ]
+        parts.append('}')
+        return ''.join(parts)
+
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records over to a bounded queue instead of writing them on the calling thread.
+
+    When the queue is full, records are dropped and counted with the 'drop' policy, or the caller
+    waits for room with the 'block' policy.
+    """
+
+    def __init__(self, log_queue, overflow_policy='drop'):
+        super().__init__(log_queue)
+        if overflow_policy not in ('drop', 'block'):
+            raise ValueError(f"Unknown log queue overflow policy: {overflow_policy}")
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments into the message now, as they may change before the record is formatted,
+        # but keep exc_info: the formatters render the stack trace themselves
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.overflow_policy == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingQueueListener:
+    """Drains the log queue on a background thread and writes the records in batches.
+
+    Each batch is formatted by every handler that accepts its records and written to the handler's
+    stream with a single write and flush, instead of one write and flush per record.
+    """
+    _sentinel = None
+
+    def __init__(self, log_queue, handlers, batch_size=512):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="log-queue-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Writes out everything still queued and stops the thread."""
+        if self._thread is not None:
+            self.queue.put(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._sentinel in batch
+            self._write([record for record in batch if record is not self._sentinel])
+            if stopping:
+                return
+
+    def _write(self, records):
+        for handler in self.handlers:
+            lines = []
+            for record in records:
+                # A record that can't be formatted is reported and skipped, it mustn't stop the thread
+                try:
+                    if record.levelno >= handler.level and handler.filter(record):
+                        lines.append(handler.format(record))
+                except Exception:
+                    handler.handleError(record)
+            if not lines:
+                continue
+            try:
+                with handler.lock:
+                    handler.stream.write(handler.terminator.join(lines) + handler.terminator)
+                    handler.stream.flush()
+            except Exception:
+                handler.handleError(records[-1])
+
+
+_queue_handler = None
+_queue_listener = None
+
+
+def set_root_handlers(min_log_level, handlers, queued=False, queue_size=10000, overflow_policy='drop'):
+    """Installs the handlers on the root logger, behind a bounded queue and a batching listener thread when queued."""
+    global _queue_handler, _queue_listener
+    previous_listener = _queue_listener
+    _queue_handler, _queue_listener = None, None
+
+    if queued:
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = BoundedQueueHandler(log_queue, overflow_policy)
+        _queue_listener = BatchingQueueListener(log_queue, handlers)
+        _queue_listener.start()
+        handlers = [_queue_handler]
+
+    # Clear existing handlers to avoid duplicates
+    root_logger = logging.getLogger()
+    root_logger.handlers = []
+    root_logger.setLevel(min_log_level)  # Capture all levels
+    root_logger.handlers = handlers
+
+    if previous_listener is not None:
+        previous_listener.stop()
+
+
+def stop_queued_logging():
+    """Flushes the records still in the log queue, called on shutdown."""
+    if _queue_listener is not None:
+        _queue_listener.stop()
+
+
+def get_dropped_log_count():
+    """Number of records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+atexit.register(stop_queued_logging)
+
+
+
+def setup_logging_gcp(min_log_level, queued=False, queue_size=10000, overflow_policy='drop', fast_json=True):
+    # Define the  JSON formatter for GCP, both produce the same output
+    formatter_class = FastJsonFormatter if fast_json else JsonFormatter
+    formatter = formatter_class()
 
     # Set up a handler for stdout
     stdout_handler = logging.StreamHandler(sys.stdout)
@@ -110,26 +335,22 @@ def setup_logging_gcp(min_log_level):
     stderr_handler.setLevel(logging.WARNING)
     stderr_handler.setFormatter(formatter)
 
-    # Clear existing handlers to avoid duplicates
-    root_logger = logging.getLogger()
-    root_logger.handlers = []
-    root_logger.setLevel(min_log_level)  # Capture all levels
-    root_logger.handlers = [stdout_handler, stderr_handler]
+    set_root_handlers(min_log_level, [stdout_handler, stderr_handler], queued, queue_size, overflow_policy)
 
 
     # Update the Uvicorn logging config dictionary
     logging_config = LOGGING_CONFIG
     logging_config['formatters']['default'] = {
-        '()': JsonFormatter,
+        '()': formatter_class,
     }
     logging_config['formatters']['access'] = {
-        '()': JsonFormatter,
+        '()': formatter_class,
     }
     logging.config.dictConfig(logging_config)
 
 
 
-def setup_logging_local(min_log_level):
+def setup_logging_local(min_log_level, queued=False, queue_size=10000, overflow_policy='drop'):
     formatter = HumanReadableFormatter()
 
     # Set up a handler for stdout
@@ -143,11 +364,7 @@ def setup_logging_local(min_log_level):
     stderr_handler.setLevel(logging.WARNING)
     stderr_handler.setFormatter(formatter)
 
-    # Clear existing handlers to avoid duplicates
-    root_logger = logging.getLogger()
-    root_logger.handlers = []
-    root_logger.setLevel(min_log_level)  # Capture all levels
-    root_logger.handlers = [stdout_handler, stderr_handler]
+    set_root_handlers(min_log_level, [stdout_handler, stderr_handler], queued, queue_size, overflow_policy)
 
 
     #  TODO: ESTO NO FUNCIONO PARA DESHACERME DE ESTOS LOGS [2024-09-17 19:20:19,264 +0100] [67874] [INFO] [h11_impl.py:476] 127.0.0.1:57426 - "GET /api/v2/history/emmanuel%40finster.ai HTTP/1.1" 200
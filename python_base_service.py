@@ -1,15 +1,18 @@
 #  python_base_service.py
 
+import asyncio
 import threading
 import logging
 from app.controller.controller import router
 from app.service import auth_service
-from app_instance import app, logger, print_test_logs
+from app_instance import app, logger, print_test_logs, startup_hooks, shutdown_hooks, LOG_QUEUE_OPTIONS
 from app.pubsub import gcp_pub_sub_consumer
+from app.grpc import base_model1_grpc_impl
 from app.grpc.base_model1_grpc_impl import serve
 from logging_config import setup_logging_gcp, setup_logging_local
 from fastapi import HTTPException
-from app.utils.api_utils import RequestStateMiddleware, custom_handle_auth_error, custom_handle_http_error, custom_handle_generic_error
+from app.utils.api_utils import RequestStateMiddleware, custom_handle_auth_error, custom_handle_http_error, custom_handle_dependency_error, custom_handle_generic_error
+from app.utils.resilience import DependencyUnavailableError
 
 # Print debug logs
 print_test_logs()
@@ -21,6 +24,7 @@ app.add_middleware(RequestStateMiddleware)
 # Register the error handlers with the app
 app.add_exception_handler(auth_service.AuthError, custom_handle_auth_error)
 app.add_exception_handler(HTTPException, custom_handle_http_error)
+app.add_exception_handler(DependencyUnavailableError, custom_handle_dependency_error)
 app.add_exception_handler(Exception, custom_handle_generic_error)
 
 
@@ -34,28 +38,51 @@ app.add_exception_handler(Exception, custom_handle_generic_error)
 
 # Start the Pub/Sub subscriber thread
 logger.info("--------------------------------    Starting Pub/Sub subscriber thread...    --------------------------------")
-logger.info("Starting the subscriber thread...")
-subscriber_thread = threading.Thread(
-    target=gcp_pub_sub_consumer.start_subscriber,
-    args=(gcp_pub_sub_consumer.consume_message,),
-    kwargs={"max_workers": 2},
-    daemon=True
-)
-subscriber_thread.start()
-logger.info("Subscriber thread started successfully.")
+def start_subscriber_thread(loop=None):
+    logger.info("Starting the subscriber thread...")
+    subscriber_thread = threading.Thread(
+        target=gcp_pub_sub_consumer.start_subscriber,
+        args=(gcp_pub_sub_consumer.build_callback(),),
+        kwargs={"loop": loop},
+        daemon=True
+    )
+    subscriber_thread.start()
+    logger.info("Subscriber thread started successfully.")
+
+
+if getattr(app.state, 'PUBSUB_CONSUMER_MODE', 'thread') == 'asyncio' and getattr(app.state, 'PUBSUB_CONSUMER_EVENT_LOOP', 'dedicated') == 'shared':
+    # Messages are dispatched on uvicorn's event loop, which only runs once the app starts
+    startup_hooks.append(lambda: start_subscriber_thread(asyncio.get_running_loop()))
+else:
+    start_subscriber_thread()
 logger.info("------------------------------    Pub/Sub subscriber started successfully   ------------------------------")
 
-# Start gRPC service in a separate thread
-logger.info("-----------------------------------    Starting gRPC service thread...    -----------------------------------")
-grpc_thread = threading.Thread(target=serve)
-grpc_thread.start()
-logger.info("----------------------------------   gRPC service started successfully   ----------------------------------")
+# On shutdown, stop taking new RPCs and messages and let the work in progress finish
+shutdown_timeout = getattr(app.state, 'APP_SHUTDOWN_TIMEOUT', 30)
+
+if getattr(app.state, 'GRPC_MODE', 'thread') == 'aio':
+    # The grpc.aio server runs on uvicorn's event loop, so it starts and stops with the app
+    logger.info("-----------------------------------    Starting gRPC aio service with the app    -----------------------------------")
+
+    async def stop_grpc_aio():
+        await base_model1_grpc_impl.stop_aio(shutdown_timeout)
+
+    startup_hooks.append(base_model1_grpc_impl.start_aio)
+    shutdown_hooks.append(stop_grpc_aio)
+else:
+    # Start gRPC service in a separate thread
+    logger.info("-----------------------------------    Starting gRPC service thread...    -----------------------------------")
+    grpc_thread = threading.Thread(target=serve)
+    grpc_thread.start()
+    logger.info("----------------------------------   gRPC service started successfully   ----------------------------------")
+    shutdown_hooks.append(lambda: base_model1_grpc_impl.stop(shutdown_timeout))
+shutdown_hooks.append(lambda: gcp_pub_sub_consumer.stop_subscriber(shutdown_timeout))
 
 # Change the log level to INFO after the startup event is complete
 if app.state.ENVIRONMENT != 'local':
-    setup_logging_gcp(logging.INFO)  # Setup logging before the app starts
+    setup_logging_gcp(logging.INFO, **LOG_QUEUE_OPTIONS)  # Setup logging before the app starts
 else:
-    setup_logging_local(logging.INFO)
+    setup_logging_local(logging.INFO, **LOG_QUEUE_OPTIONS)
 
 
 